@@ -0,0 +1,30 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# ControlNetworkManager is released under the terms of the LGPLv3 or higher.
+
+from PyQt5.QtCore import QObject
+from PyQt5.QtNetwork import QNetworkAccessManager, QSslConfiguration
+
+from typing import Optional
+
+#
+# A network manager for control commands (pause, cancel, gcode), which has a connection pool of its
+# own, so control commands never queue behind status polls or uploads on other managers.
+# The connection to the instance is opened before the first command is sent, and warmUp() should be
+# called periodically (eg with every status poll) to reopen it if the server closed it because it
+# was idle. Opening a connection that is already open does nothing.
+#
+class ControlNetworkManager(QNetworkAccessManager):
+    def __init__(self, address: str, port: int, ssl_configuration: Optional[QSslConfiguration] = None, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+
+        self._address = address
+        self._port = port
+        self._ssl_configuration = ssl_configuration  # Set if the instance is connected to with https
+
+        self.warmUp()
+
+    def warmUp(self) -> None:
+        if self._ssl_configuration is not None:
+            self.connectToHostEncrypted(self._address, self._port, self._ssl_configuration)
+        else:
+            self.connectToHost(self._address, self._port)
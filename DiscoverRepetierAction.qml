@@ -409,6 +409,28 @@ Cura.MachineAction
                         }
                     }
                     CheckBox
+                    {
+                        id: cameraSnapshotsCheckBox
+                        text: catalog.i18nc("@label", "Show webcam snapshots instead of a video stream")
+                        enabled: manager.instanceSupportsCamera
+                        checked: manager.instanceApiKeyAccepted && Cura.ContainerManager.getContainerMetaDataEntry(Cura.MachineManager.activeMachine.id, "repetier_camera_snapshots") == "true"
+                        onClicked:
+                        {
+                            manager.setContainerMetaDataEntry(Cura.MachineManager.activeMachine.id, "repetier_camera_snapshots", String(checked))
+                        }
+                    }
+                    CheckBox
+                    {
+                        id: timelapseCheckBox
+                        text: catalog.i18nc("@label", "Record a webcam timelapse while printing")
+                        enabled: manager.instanceSupportsCamera
+                        checked: manager.instanceApiKeyAccepted && Cura.ContainerManager.getContainerMetaDataEntry(Cura.MachineManager.activeMachine.id, "repetier_timelapse") == "true"
+                        onClicked:
+                        {
+                            manager.setContainerMetaDataEntry(Cura.MachineManager.activeMachine.id, "repetier_timelapse", String(checked))
+                        }
+                    }
+                    CheckBox
                     {
                         id: flipYCheckBox
                         text: catalog.i18nc("@label", "Flip Webcam Y")
@@ -0,0 +1,107 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# GcodeCoalescer is released under the terms of the LGPLv3 or higher.
+
+from decimal import Decimal, InvalidOperation
+
+from typing import List, Optional
+
+##  Drop commands from a queued batch that are superseded by later commands in the same batch.
+#   Temperature setpoints only keep the latest value per heater, and consecutive relative moves
+#   (as sent by jogging) along the same axes are merged into a single move. Moves that cancel each
+#   other out are dropped.
+def coalesceGcode(commands: List[str]) -> List[str]:
+    result = []  # type: List[str]
+    relative = []  # type: List[bool]  # positioning mode in effect before each command in result
+    for command in commands:
+        words = _gcodeWords(command)
+        code = words[0] if words else ""
+        in_relative = bool(relative) and _isRelativeAfter(result[-1], relative[-1])
+
+        setpoint_key = _setpointKey(words)
+        if setpoint_key:
+            for index in range(len(result) - 1, -1, -1):
+                previous_key = _setpointKey(_gcodeWords(result[index]))
+                if not previous_key:
+                    break
+                if previous_key == setpoint_key:
+                    del result[index]
+                    del relative[index]
+                    break
+
+        elif code == "G91" and result and _gcodeCode(result[-1]) == "G90" and relative[-1]:
+            # G90 directly followed by G91 leaves the positioning mode unchanged
+            result.pop()
+            relative.pop()
+            continue
+
+        elif code in ("G0", "G1") and in_relative and result and relative[-1]:
+            merged = _mergeRelativeMoves(_gcodeWords(result[-1]), words)
+            if merged is not None:
+                if merged:
+                    result[-1] = merged
+                else:
+                    result.pop()
+                    relative.pop()
+                continue
+
+        result.append(command)
+        relative.append(in_relative)
+    return result
+
+##  Get the words of a gcode command, without its comment and in upper case
+def _gcodeWords(command: str) -> List[str]:
+    return command.split(";", 1)[0].strip().upper().split()
+
+def _gcodeCode(command: str) -> str:
+    words = _gcodeWords(command)
+    return words[0] if words else ""
+
+def _isRelativeAfter(command: str, relative: bool) -> bool:
+    code = _gcodeCode(command)
+    if code == "G91":
+        return True
+    if code == "G90":
+        return False
+    return relative
+
+def _setpointKey(words: List[str]) -> Optional[str]:
+    if not words or words[0] not in ("M104", "M140", "M106", "M107"):
+        return None
+    if words[0] in ("M106", "M107"):
+        # fan speeds are tracked per fan, and M107 turns off the same fan as M106
+        fan = [word for word in words[1:] if word.startswith("P")]
+        return "fan" + (fan[0] if fan else "P0")
+    tool = [word for word in words[1:] if word.startswith("T")]
+    return words[0] + (tool[0] if tool else "")
+
+##  Merge two relative moves along the same axes into one move. Returns None if the moves can not be
+#   merged, and an empty string if they cancel each other out.
+def _mergeRelativeMoves(previous_words: List[str], words: List[str]) -> Optional[str]:
+    if not previous_words or previous_words[0] != words[0]:
+        return None
+    previous_axes = {word[0]: word[1:] for word in previous_words[1:] if word[:1] in "XYZE"}
+    axes = {word[0]: word[1:] for word in words[1:] if word[:1] in "XYZE"}
+    if not axes or set(axes) != set(previous_axes) or "E" in axes:
+        return None
+    feedrates = [word for word in words[1:] if word.startswith("F")] or [word for word in previous_words[1:] if word.startswith("F")]
+    others = [word for word in words[1:] if word[:1] not in "XYZEF"]
+    if others:
+        return None
+    # The distances are added as decimals, so the sum is exact and is never written in exponent notation
+    merged = []
+    for axis in sorted(axes):
+        try:
+            distance = Decimal(previous_axes[axis]) + Decimal(axes[axis])
+        except InvalidOperation:
+            return None
+        if not distance.is_finite():
+            return None
+        if distance != 0:
+            merged.append(axis + _formatDistance(distance))
+    if not merged:
+        # Keep the feedrate, which later moves use as well
+        return " ".join([words[0]] + feedrates) if feedrates else ""
+    return " ".join([words[0]] + merged + feedrates)
+
+def _formatDistance(distance: Decimal) -> str:
+    return format(distance.normalize(), "f")
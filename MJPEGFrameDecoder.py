@@ -0,0 +1,197 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# MJPEGFrameDecoder is released under the terms of the LGPLv3 or higher.
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, QBuffer, QByteArray, QIODevice, QSize, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader
+
+import math
+from time import monotonic, perf_counter
+
+from typing import Optional
+
+#
+# The signal a decode task uses to hand its result back to the thread the decoder lives in.
+#
+class _DecodeTaskSignals(QObject):
+    finished = pyqtSignal(QImage, QSize, float, float, int)
+
+#
+# Decodes a single jpeg frame on a thread from the pool. If a target size is specified, the frame is
+# decoded at the smallest size that still covers the target size, which lets the jpeg decoder skip
+# most of the work for frames that are much larger than they are displayed. The frame is mirrored
+# if needed, and converted to a pixel format that can be painted without conversion.
+#
+class _DecodeTask(QRunnable):
+    def __init__(self, data: bytes, received_time: float, target_size: QSize, mirror: bool, generation: int) -> None:
+        super().__init__()
+        self.signals = _DecodeTaskSignals()
+
+        self._data = data
+        self._received_time = received_time
+        self._target_size = target_size
+        self._mirror = mirror
+        self._generation = generation
+
+    def run(self) -> None:
+        start_time = perf_counter()
+        buffer = QBuffer()
+        buffer.setData(QByteArray(self._data))
+        buffer.open(QIODevice.ReadOnly)
+        reader = QImageReader(buffer)
+
+        source_size = reader.size()
+        if self._target_size.isValid() and not self._target_size.isEmpty() and source_size.isValid():
+            scale = max(
+                self._target_size.width() / source_size.width(),
+                self._target_size.height() / source_size.height()
+            )
+            if scale < 1:
+                reader.setScaledSize(QSize(
+                    math.ceil(source_size.width() * scale),
+                    math.ceil(source_size.height() * scale)
+                ))
+
+        image = reader.read()
+        if not source_size.isValid():
+            source_size = image.size()
+
+        # Prepare the image for painting here, so painting it does not need to transform or convert it
+        if self._mirror:
+            image = image.mirrored()
+        if image.format() not in (QImage.Format_RGB32, QImage.Format_ARGB32_Premultiplied):
+            image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+        self.signals.finished.emit(image, source_size, perf_counter() - start_time, self._received_time, self._generation)
+
+#
+# Decodes jpeg frames off the GUI thread. At most one frame is decoded at a time; while it is
+# being decoded, only the most recent frame that arrives is kept to be decoded next, and any
+# frame it replaces is dropped.
+#
+# All decoders share a thread pool and a budget of decoded pixels per second. Decoders that are not
+# high priority wait for the budget to allow their next frame, so they automatically decode fewer
+# frames when the high priority decoders use up most of the budget.
+#
+class MJPEGFrameDecoder(QObject):
+    _thread_pool = None  # type: Optional[QThreadPool]
+
+    _pixel_budget = 1920 * 1080 * 30  # Decoded pixels per second
+    _pixel_tokens = 0.0
+    _pixel_tokens_time = 0.0
+
+    # The decoded image, the size of the frame before it was scaled, the time it took to decode the
+    # frame and the (monotonic) time at which the frame was received
+    frameDecoded = pyqtSignal(QImage, QSize, float, float)
+
+    def __init__(self, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+
+        self._task = None  # type: Optional[_DecodeTask]
+        self._pending_data = None  # type: Optional[bytes]
+        self._pending_received_time = 0.0
+        self._target_size = QSize()
+        self._mirror = False
+        self._high_priority = True
+        self._frame_pixels = 0  # Size of the most recently decoded frame
+        self._generation = 0  # Results from tasks of an earlier generation are ignored
+
+        self._decoded_frames = 0
+        self._dropped_frames = 0
+
+        self._budget_timer = QTimer()
+        self._budget_timer.setSingleShot(True)
+        self._budget_timer.timeout.connect(self._startPendingTask)
+
+    ##  Get the pool of threads that is shared by all decoders
+    @classmethod
+    def getThreadPool(cls) -> QThreadPool:
+        if cls._thread_pool is None:
+            cls._thread_pool = QThreadPool()
+            cls._thread_pool.setMaxThreadCount(max(QThreadPool.globalInstance().maxThreadCount() // 2, 1))
+        return cls._thread_pool
+
+    ##  Set the number of decoded pixels per second that is shared by all decoders
+    @classmethod
+    def setPixelBudget(cls, pixels_per_second: int) -> None:
+        cls._pixel_budget = max(pixels_per_second, 1)
+
+    # Take the pixels needed to decode a frame from the budget. The budget saves up to a second of
+    # pixels; high priority decoders may overdraw it.
+    @classmethod
+    def _takePixelBudget(cls, pixels: int, high_priority: bool) -> float:
+        now = monotonic()
+        cls._pixel_tokens = min(cls._pixel_tokens + (now - cls._pixel_tokens_time) * cls._pixel_budget, cls._pixel_budget)
+        cls._pixel_tokens_time = now
+        if not high_priority and cls._pixel_tokens < pixels:
+            # Time until the budget allows this frame
+            return (pixels - cls._pixel_tokens) / cls._pixel_budget
+        cls._pixel_tokens = max(cls._pixel_tokens - pixels, -cls._pixel_budget)
+        return 0.0
+
+    def setHighPriority(self, high_priority: bool) -> None:
+        self._high_priority = high_priority
+
+    ##  Set the size frames are displayed at. Frames are decoded at full size if the size is invalid.
+    def setTargetSize(self, target_size: QSize) -> None:
+        self._target_size = QSize(target_size)
+
+    def setMirror(self, mirror: bool) -> None:
+        if mirror == self._mirror:
+            return
+        self._mirror = mirror
+        # A frame that is being decoded with the previous setting would be shown the wrong way round
+        self.reset()
+
+    def decode(self, data: bytes, received_time: Optional[float] = None) -> None:
+        if received_time is None:
+            received_time = monotonic()
+        if self._pending_data is not None:
+            self._dropped_frames += 1
+        self._pending_data = data
+        self._pending_received_time = received_time
+        if self._task is None and not self._budget_timer.isActive():
+            self._startPendingTask()
+
+    ##  Forget about any frames that are waiting or being decoded
+    def reset(self) -> None:
+        self._generation += 1
+        self._pending_data = None
+        self._budget_timer.stop()
+
+    def dropFrames(self, count: int) -> None:
+        self._dropped_frames += count
+
+    @property
+    def decodedFrames(self) -> int:
+        return self._decoded_frames
+
+    @property
+    def droppedFrames(self) -> int:
+        return self._dropped_frames
+
+    def _startPendingTask(self) -> None:
+        if self._pending_data is None or self._task is not None:
+            return
+        wait_time = self._takePixelBudget(self._frame_pixels, self._high_priority)
+        if wait_time > 0:
+            self._budget_timer.start(max(int(wait_time * 1000), 10))
+            return
+
+        data = self._pending_data
+        self._pending_data = None
+        self._startTask(data, self._pending_received_time)
+
+    def _startTask(self, data: bytes, received_time: float) -> None:
+        self._task = _DecodeTask(data, received_time, self._target_size, self._mirror, self._generation)
+        self._task.signals.finished.connect(self._onTaskFinished)
+        self.getThreadPool().start(self._task)
+
+    def _onTaskFinished(self, image: QImage, source_size: QSize, decode_time: float, received_time: float, generation: int) -> None:
+        self._task = None
+
+        if not image.isNull():
+            self._frame_pixels = image.width() * image.height()
+        if generation == self._generation and not image.isNull():
+            self._decoded_frames += 1
+            self.frameDecoded.emit(image, source_size, decode_time, received_time)
+
+        self._startPendingTask()
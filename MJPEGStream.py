@@ -0,0 +1,393 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# MJPEGStream is released under the terms of the LGPLv3 or higher.
+
+from PyQt5.QtCore import QObject, QUrl, QTimer, QSize, pyqtSignal
+from PyQt5.QtGui import QImage
+from PyQt5.QtNetwork import QNetworkRequest, QNetworkReply, QNetworkAccessManager
+
+from UM.Logger import Logger
+
+from .MJPEGStreamParser import MJPEGStreamParser
+from .MJPEGFrameDecoder import MJPEGFrameDecoder
+from .MJPEGStreamMetrics import MJPEGStreamMetrics
+
+from typing import Dict, Optional, Set, Tuple
+
+#
+# A camera stream that is shared by all views that show the same camera. The stream progressively
+# downloads a network mjpeg stream, picks it apart in individual jpeg frames and decodes them off
+# the GUI thread. Alternatively, if a snapshot interval is set, it periodically requests single
+# jpeg snapshots. Snapshots are requested conditionally, and the interval is increased while the
+# image does not change. Cameras without a snapshot url take their snapshots from the mjpeg
+# stream, which is closed as soon as its first frame is received.
+#
+# Streams are obtained with getStream(). The stream runs while at least one subscribed view is not
+# paused; the last decoded frame is kept, so views can show it immediately when they (re)subscribe.
+# When the last view unsubscribes, the stream is released after a short delay, so a view that
+# resubscribes right away (eg when switching between cameras) gets the same stream back.
+# Subscribers that only use the raw jpeg data of the frames don't cause frames to be decoded.
+#
+class MJPEGStream(QObject):
+    _streams = {}  # type: Dict[Tuple[str, str, int], MJPEGStream]
+
+    _release_delay = 5000  # ms between the last view unsubscribing and the stream being released
+
+    frameChanged = pyqtSignal()
+    frameReceived = pyqtSignal(bytes)  # The raw jpeg data of each new frame, before it is decoded
+    sourceSizeChanged = pyqtSignal()
+    frameCountsChanged = pyqtSignal()
+    metricsChanged = pyqtSignal()
+
+    ##  Get the stream for a camera, creating it if there is no stream for it yet
+    @classmethod
+    def getStream(cls, source_url: QUrl, snapshot_url: QUrl = QUrl(), snapshot_interval: int = 0) -> "MJPEGStream":
+        snapshot_interval = max(snapshot_interval, 0)
+        key = (source_url.toString(), snapshot_url.toString() if snapshot_interval else "", snapshot_interval)
+        stream = cls._streams.get(key)
+        if stream is None:
+            stream = MJPEGStream(source_url, snapshot_url, snapshot_interval)
+            stream._key = key
+            cls._streams[key] = stream
+        return stream
+
+    def __init__(self, source_url: QUrl, snapshot_url: QUrl, snapshot_interval: int, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+
+        self._key = None  # type: Optional[Tuple[str, str, int]]  # Key of the stream in the registry of streams
+
+        self._source_url = QUrl(source_url)
+        self._snapshot_url = QUrl(snapshot_url)
+        self._snapshot_interval = snapshot_interval  # ms; 0 means the mjpeg stream is used instead of snapshots
+
+        self._stream_parser = MJPEGStreamParser()
+        self._frame_decoder = MJPEGFrameDecoder(self)
+        self._frame_decoder.frameDecoded.connect(self._onFrameDecoded)
+        self._network_manager = None  # type: Optional[QNetworkAccessManager]
+        self._image_request = None  # type: Optional[QNetworkRequest]
+        self._image_reply = None  # type: Optional[QNetworkReply]
+        self._image = QImage()
+        self._source_size = QSize()  # Size of the camera frames, which may be larger than the decoded image
+        self._mirror = False
+
+        self._snapshot_timer = QTimer()
+        self._snapshot_timer.setSingleShot(True)
+        self._snapshot_timer.timeout.connect(self._requestSnapshot)
+        self._snapshot_etag = b""
+        self._snapshot_last_modified = b""
+        self._snapshot_hash = None  # type: Optional[int]
+        self._snapshot_frame = None  # type: Optional[bytes]  # Frame taken from the stream for a snapshot
+
+        self._metrics = MJPEGStreamMetrics()
+        # Metrics such as the age of the frame change continuously, so they are refreshed periodically
+        self._metrics_timer = QTimer()
+        self._metrics_timer.setInterval(1000)
+        self._metrics_timer.timeout.connect(self.metricsChanged)
+
+        self._views = {}  # type: Dict[int, bool]  # Subscribed views, and whether they are paused
+        self._target_sizes = {}  # type: Dict[int, QSize]
+        self._background_views = set()  # type: Set[int]  # Views that don't need every frame
+        self._raw_frame_views = set()  # type: Set[int]  # Subscribers that don't need decoded frames
+        self._running = False
+
+        self._release_timer = QTimer()
+        self._release_timer.setSingleShot(True)
+        self._release_timer.setInterval(self._release_delay)
+        self._release_timer.timeout.connect(self._release)
+
+    ##  Subscribe a view to the stream.
+    #   \param raw_frames_only Whether the view only uses the frameReceived signal, so it does not
+    #   need frames to be decoded.
+    def subscribe(self, view: QObject, paused: bool = False, raw_frames_only: bool = False) -> None:
+        self._release_timer.stop()
+        self._views[id(view)] = paused
+        if raw_frames_only:
+            self._raw_frame_views.add(id(view))
+        else:
+            self._raw_frame_views.discard(id(view))
+        self._updatePriority()
+        self._updateRunning()
+
+    def unsubscribe(self, view: QObject) -> None:
+        self._views.pop(id(view), None)
+        self._background_views.discard(id(view))
+        self._raw_frame_views.discard(id(view))
+        self._updatePriority()
+        if self._target_sizes.pop(id(view), None) is not None:
+            self._updateTargetSize()
+        self._updateRunning()
+        if not self._views:
+            self._release_timer.start()
+
+    def setPaused(self, view: QObject, paused: bool) -> None:
+        if id(view) not in self._views:
+            return
+        self._views[id(view)] = paused
+        self._updateRunning()
+
+    ##  Set whether a view shows the stream in the background, in which case it does not need every
+    #   frame. Frames of streams that are only shown in the background are decoded with low priority.
+    def setBackground(self, view: QObject, background: bool) -> None:
+        if background:
+            self._background_views.add(id(view))
+        else:
+            self._background_views.discard(id(view))
+        self._updatePriority()
+
+    def _updatePriority(self) -> None:
+        self._frame_decoder.setHighPriority(not self._views or any(
+            view not in self._background_views and view not in self._raw_frame_views for view in self._views
+        ))
+
+    # Whether any view that is not paused shows the decoded frames
+    def _needsDecodedFrames(self) -> bool:
+        return any(not paused and view not in self._raw_frame_views for view, paused in self._views.items())
+
+    ##  Set the size in device pixels a view displays the frames at.
+    #   Frames are decoded at the largest size any of the views needs.
+    def setTargetSize(self, view: QObject, target_size: QSize) -> None:
+        if self._target_sizes.get(id(view)) == target_size:
+            return
+        self._target_sizes[id(view)] = QSize(target_size)
+        self._updateTargetSize()
+
+    def setMirror(self, mirror: bool) -> None:
+        if mirror == self._mirror:
+            return
+        self._mirror = mirror
+        self._frame_decoder.setMirror(mirror)
+        if not self._image.isNull():
+            self._image = self._image.mirrored()
+            self.frameChanged.emit()
+
+    def getImage(self) -> QImage:
+        return self._image
+
+    def getSourceSize(self) -> QSize:
+        return self._source_size
+
+    def isRunning(self) -> bool:
+        return self._running
+
+    @property
+    def decodedFrames(self) -> int:
+        return self._frame_decoder.decodedFrames
+
+    @property
+    def droppedFrames(self) -> int:
+        return self._frame_decoder.droppedFrames
+
+    @property
+    def streamResyncs(self) -> int:
+        return self._stream_parser.resyncs
+
+    def getMetrics(self) -> MJPEGStreamMetrics:
+        return self._metrics
+
+    def _updateRunning(self) -> None:
+        should_run = any(not paused for paused in self._views.values())
+        if should_run and not self._running:
+            self._start()
+        elif not should_run and self._running:
+            self._stop()
+
+    def _updateTargetSize(self) -> None:
+        width = max([size.width() for size in self._target_sizes.values()], default = 0)
+        height = max([size.height() for size in self._target_sizes.values()], default = 0)
+        self._frame_decoder.setTargetSize(QSize(width, height) if width > 0 and height > 0 else QSize())
+
+    def _start(self) -> None:
+        if self._network_manager is None:
+            self._network_manager = QNetworkAccessManager()
+
+        if self._snapshot_interval > 0:
+            if not self._snapshot_url.isValid() and not self._source_url.isValid():
+                Logger.log("w", "Unable to start camera snapshots without target!")
+                return
+            self._running = True
+            self._metrics_timer.start()
+            Logger.log("d", "MJPEG starting snapshots...")
+            self._requestSnapshot()
+            return
+
+        if not self._source_url.isValid():
+            Logger.log("w", "Unable to start camera stream without target!")
+            return
+        self._running = True
+        self._metrics_timer.start()
+        Logger.log("d", "MJPEG starting stream...")
+        self._image_request = QNetworkRequest(self._source_url)
+        self._image_reply = self._network_manager.get(self._image_request)
+        self._image_reply.metaDataChanged.connect(self._onStreamMetaDataChanged)
+        self._image_reply.downloadProgress.connect(self._onStreamDownloadProgress)
+
+    def _stop(self) -> None:
+        Logger.log("d", "MJPEG stopping stream...")
+        self._stream_parser.setBoundary(None)
+        self._frame_decoder.reset()
+        self._snapshot_timer.stop()
+        self._metrics_timer.stop()
+        self._metrics.reset()
+
+        if self._image_reply:
+            try:
+                for signal, slot in [
+                    (self._image_reply.metaDataChanged, self._onStreamMetaDataChanged),
+                    (self._image_reply.downloadProgress, self._onStreamDownloadProgress),
+                    (self._image_reply.downloadProgress, self._onSnapshotDownloadProgress),
+                    (self._image_reply.finished, self._onSnapshotFinished)
+                ]:
+                    try:
+                        signal.disconnect(slot)
+                    except Exception:
+                        pass
+
+                if not self._image_reply.isFinished():
+                    self._image_reply.close()
+            except Exception as e:  # RuntimeError
+                pass  # It can happen that the wrapped c++ object is already deleted.
+
+            self._image_reply = None
+            self._image_request = None
+
+        self._running = False
+
+    # Drop the stream from the registry and free its network manager and last frame, unless a view
+    # subscribed again since the last one unsubscribed
+    def _release(self) -> None:
+        if self._views:
+            return
+        if self._running:
+            self._stop()
+        if self._key is not None and self._streams.get(self._key) is self:
+            del self._streams[self._key]
+        self._key = None
+
+        self._network_manager = None
+        self._image = QImage()
+        self._source_size = QSize()
+        self._snapshot_etag = b""
+        self._snapshot_last_modified = b""
+        self._snapshot_hash = None
+        Logger.log("d", "MJPEG released stream %s", self._source_url.toString())
+
+    def _requestSnapshot(self) -> None:
+        if not self._running:
+            return
+        if not self._snapshot_url.isValid():
+            # Take the snapshot from the mjpeg stream instead
+            self._stream_parser.setBoundary(None)
+            self._snapshot_frame = None
+            self._image_request = QNetworkRequest(self._source_url)
+            self._image_reply = self._network_manager.get(self._image_request)
+            self._image_reply.metaDataChanged.connect(self._onStreamMetaDataChanged)
+            self._image_reply.downloadProgress.connect(self._onSnapshotDownloadProgress)
+            self._image_reply.finished.connect(self._onSnapshotFinished)
+            return
+
+        self._image_request = QNetworkRequest(self._snapshot_url)
+        # Only transfer the snapshot if it changed since the previous one
+        if self._snapshot_etag:
+            self._image_request.setRawHeader(b"If-None-Match", self._snapshot_etag)
+        if self._snapshot_last_modified:
+            self._image_request.setRawHeader(b"If-Modified-Since", self._snapshot_last_modified)
+
+        self._image_reply = self._network_manager.get(self._image_request)
+        self._image_reply.finished.connect(self._onSnapshotFinished)
+
+    def _onSnapshotDownloadProgress(self, bytes_received: int, bytes_total: int) -> None:
+        if self._image_reply is None or self._snapshot_frame is not None:
+            return
+        data = bytes(self._image_reply.readAll())
+        self._metrics.bytesReceived(len(data))
+        frames = self._stream_parser.feed(data)
+        if frames:
+            # One frame is all that is needed; closing the stream finishes the reply
+            self._snapshot_frame = frames[0]
+            self._image_reply.abort()
+
+    def _onSnapshotFinished(self) -> None:
+        reply = self._image_reply
+        if reply is None:
+            return
+        self._image_reply = None
+        self._image_request = None
+
+        changed = False
+        data = None  # type: Optional[bytes]
+        http_status_code = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        if self._snapshot_frame is not None:
+            data = self._snapshot_frame
+            self._snapshot_frame = None
+        elif reply.error() == QNetworkReply.NoError and http_status_code == 200:
+            self._snapshot_etag = bytes(reply.rawHeader(b"ETag"))
+            self._snapshot_last_modified = bytes(reply.rawHeader(b"Last-Modified"))
+            data = bytes(reply.readAll())
+            self._metrics.bytesReceived(len(data))
+        elif http_status_code != 304:
+            Logger.log("w", "Could not get camera snapshot: %s", reply.errorString())
+        reply.deleteLater()
+
+        if data is not None:
+            self._metrics.framesReceived(1)
+            snapshot_hash = hash(data)
+            if snapshot_hash != self._snapshot_hash:
+                self._snapshot_hash = snapshot_hash
+                self.frameReceived.emit(data)
+                if self._needsDecodedFrames():
+                    self._frame_decoder.decode(data)
+                changed = True
+
+        if not self._running:
+            return
+        # Poll less often while nothing changes, up to 8 times the configured interval
+        if changed:
+            interval = self._snapshot_interval
+        else:
+            interval = min(max(self._snapshot_timer.interval(), self._snapshot_interval) * 2, self._snapshot_interval * 8)
+        self._snapshot_timer.start(interval)
+
+    def _onStreamMetaDataChanged(self) -> None:
+        if self._image_reply is None:
+            return
+        # Most mjpeg servers send a multipart stream, which can be split using the part headers
+        content_type = bytes(self._image_reply.rawHeader(b"Content-Type"))
+        boundary = MJPEGStreamParser.boundaryFromContentType(content_type)
+        if boundary != self._stream_parser.boundary:
+            self._stream_parser.setBoundary(boundary)
+
+    def _onStreamDownloadProgress(self, bytes_received: int, bytes_total: int) -> None:
+        # An MJPG stream is (for our purpose) a stream of concatenated JPG images, usually wrapped in
+        # a multipart stream.
+        if self._image_reply is None:
+            return
+        resyncs = self._stream_parser.resyncs
+        data = bytes(self._image_reply.readAll())
+        self._metrics.bytesReceived(len(data))
+        frames = self._stream_parser.feed(data)
+        if self._stream_parser.resyncs != resyncs:
+            Logger.log("w", "MJPEG buffer exceeds reasonable size. Skipping to the next frame...")
+            self.frameCountsChanged.emit()
+        if not frames:
+            return
+        self._metrics.framesReceived(len(frames))
+
+        self.frameReceived.emit(frames[-1])
+        if not self._needsDecodedFrames():
+            return
+
+        # If more than a single frame was received, only show the most recent one. We do it like
+        # this in order not to get a buildup of frames
+        if len(frames) > 1:
+            self._frame_decoder.dropFrames(len(frames) - 1)
+        self._frame_decoder.decode(frames[-1])
+
+    def _onFrameDecoded(self, image: QImage, source_size: QSize, decode_time: float, received_time: float) -> None:
+        self._image = image
+        self._metrics.frameDisplayed(decode_time, received_time)
+
+        if source_size != self._source_size:
+            self._source_size = source_size
+            self.sourceSizeChanged.emit()
+
+        self.frameCountsChanged.emit()
+        self.frameChanged.emit()
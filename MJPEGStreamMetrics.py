@@ -0,0 +1,88 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# MJPEGStreamMetrics is released under the terms of the LGPLv3 or higher.
+
+from collections import deque
+from time import monotonic
+
+from typing import Deque, Optional, Tuple
+
+#
+# Keeps track of the performance of a camera stream over fixed-size rolling windows, so it can be
+# told whether a laggy camera feed is caused by the network, the parser or the decoder.
+#
+class MJPEGStreamMetrics:
+    def __init__(self, window_size: int = 60) -> None:
+        self._received_frame_times = deque(maxlen = window_size)  # type: Deque[float]
+        self._displayed_frame_times = deque(maxlen = window_size)  # type: Deque[float]
+        self._received_bytes = deque(maxlen = window_size)  # type: Deque[Tuple[float, int]]
+        self._decode_times = deque(maxlen = window_size)  # type: Deque[float]
+
+        self._displayed_frame_received_time = None  # type: Optional[float]
+
+    def reset(self) -> None:
+        self._received_frame_times.clear()
+        self._displayed_frame_times.clear()
+        self._received_bytes.clear()
+        self._decode_times.clear()
+
+    def bytesReceived(self, byte_count: int, now: Optional[float] = None) -> None:
+        self._received_bytes.append((monotonic() if now is None else now, byte_count))
+
+    def framesReceived(self, frame_count: int, now: Optional[float] = None) -> None:
+        now = monotonic() if now is None else now
+        for _ in range(frame_count):
+            self._received_frame_times.append(now)
+
+    ##  Register that a frame was decoded and displayed.
+    #   \param decode_time The time it took to decode the frame, in seconds.
+    #   \param received_time The time at which the frame was received.
+    def frameDisplayed(self, decode_time: float, received_time: float, now: Optional[float] = None) -> None:
+        self._displayed_frame_times.append(monotonic() if now is None else now)
+        self._decode_times.append(decode_time)
+        self._displayed_frame_received_time = received_time
+
+    @property
+    def receivedFps(self) -> float:
+        return self._rate(self._received_frame_times)
+
+    @property
+    def displayedFps(self) -> float:
+        return self._rate(self._displayed_frame_times)
+
+    @property
+    def bytesPerSecond(self) -> float:
+        if len(self._received_bytes) < 2:
+            return 0.0
+        duration = monotonic() - self._received_bytes[0][0]
+        if duration <= 0:
+            return 0.0
+        # The first chunk was received at the start of the window, so it is not part of the rate
+        return sum(byte_count for _, byte_count in list(self._received_bytes)[1:]) / duration
+
+    @property
+    def averageDecodeTime(self) -> float:
+        if not self._decode_times:
+            return 0.0
+        return sum(self._decode_times) / len(self._decode_times)
+
+    @property
+    def maximumDecodeTime(self) -> float:
+        return max(self._decode_times, default = 0.0)
+
+    ##  Time since the frame that is displayed was received, in seconds
+    @property
+    def frameAge(self) -> float:
+        if self._displayed_frame_received_time is None:
+            return 0.0
+        return monotonic() - self._displayed_frame_received_time
+
+    # Events per second over the window. The rate is measured up to now, so it drops off when
+    # events stop coming in.
+    @staticmethod
+    def _rate(event_times: Deque[float]) -> float:
+        if len(event_times) < 2:
+            return 0.0
+        duration = monotonic() - event_times[0]
+        if duration <= 0:
+            return 0.0
+        return (len(event_times) - 1) / duration
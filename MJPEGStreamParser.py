@@ -0,0 +1,325 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# MJPEGStreamParser is released under the terms of the LGPLv3 or higher.
+
+import re
+
+from typing import List, Optional, Union
+
+#
+# Splits an mjpeg stream into individual jpeg frames as the stream is received in chunks.
+# Only newly received bytes are scanned; the scan position and any partially received frame are
+# kept between chunks, and bytes that belong to frames that were handed out are discarded.
+#
+# If the boundary of a multipart/x-mixed-replace stream is set, the stream is split on the multipart
+# boundaries, and the Content-Length header of each part is used to skip straight to the end of the
+# frame. Otherwise (or for parts without a Content-Length) jpeg frames are found by their markers;
+# the segments in the header of a frame are skipped by their length, so embedded thumbnails don't
+# end the frame early.
+#
+# The buffer is bounded; if a frame grows beyond the maximum size, the parser skips ahead to the
+# next start marker or part boundary.
+#
+class MJPEGStreamParser:
+    # JPG images start with the marker 0xFFD8, and end with 0xFFD9
+    SOI_MARKER = b"\xff\xd8"
+    EOI_MARKER = b"\xff\xd9"
+
+    # Amount of data after which a multipart stream without any recognisable parts is parsed by its markers
+    MAX_BOUNDARY_SEARCH = 1000000
+
+    # Results of skipping the segments of a frame, other than the index of an end marker
+    _SEGMENTS_INCOMPLETE = -1
+    _SEGMENTS_INVALID = -2
+
+    def __init__(self, max_buffer_size: int = 2000000) -> None:
+        self._max_buffer_size = max_buffer_size  # No single camera frame should be 2 Mb or larger
+        self._buffer = bytearray()
+        self._scan_index = 0  # Index in the buffer from which the next marker search starts
+        self._frame_start_index = -1  # Index of the start marker (or part boundary) of the frame being received, if any
+        self._in_segments = False  # Whether the scan is still in the segments before the image data of the frame
+        self._segment_checked_index = -1  # Index up to which the data of the segment being skipped was checked
+        self._segment_images = 0  # Start and end markers of embedded images found in the segment being skipped
+
+        self._delimiter = None  # type: Optional[bytes]
+        self._body_index = -1  # Index of the body of the multipart part being received, if its headers are complete
+        self._body_length = -1  # Content-Length of the part being received, or -1 if it has none
+
+        self._bytes_received = 0
+        self._frames_found = 0
+        self._resyncs = 0
+
+    def reset(self) -> None:
+        self._buffer = bytearray()
+        self._scan_index = 0
+        self._frame_start_index = -1
+        self._in_segments = False
+        self._segment_checked_index = -1
+        self._body_index = -1
+        self._body_length = -1
+
+    ##  Set the multipart boundary of the stream, or None to find frames by their jpeg markers
+    def setBoundary(self, boundary: Optional[bytes]) -> None:
+        self.reset()
+        if boundary and boundary.startswith(b"--"):
+            # Some servers include the dashes of the delimiter in the boundary parameter
+            boundary = boundary[2:]
+        self._delimiter = b"--" + boundary if boundary else None
+
+    @property
+    def boundary(self) -> Optional[bytes]:
+        return self._delimiter[2:] if self._delimiter else None
+
+    ##  Get the multipart boundary from the value of a Content-Type header, if it specifies one
+    @staticmethod
+    def boundaryFromContentType(content_type: Union[str, bytes]) -> Optional[bytes]:
+        if isinstance(content_type, str):
+            content_type = content_type.encode("latin-1", "ignore")
+        if not content_type.lower().startswith(b"multipart/"):
+            return None
+        match = re.search(rb"boundary\s*=\s*(\"[^\"]+\"|[^;\s]+)", content_type, re.IGNORECASE)
+        if not match:
+            return None
+        return match.group(1).strip(b"\"")
+
+    ##  Add a chunk of received data to the stream.
+    #   \return The frames that were completed by this chunk, in the order they were received.
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> List[bytes]:
+        self._buffer += data
+        self._bytes_received += len(data)
+
+        frames = []  # type: List[bytes]
+        if self._delimiter:
+            self._feedMultipart(frames)
+            if not frames and self._frames_found == 0 and self._frame_start_index == -1 and self._bytes_received > self.MAX_BOUNDARY_SEARCH:
+                # The announced boundary never shows up in the stream; look for jpeg markers instead
+                self._delimiter = None
+                self._scan_index = 0
+        if not self._delimiter:
+            self._feedMarkers(frames)
+
+        if len(self._buffer) > self._max_buffer_size:
+            self._resync()
+            if self._delimiter:
+                self._feedMultipart(frames)
+            else:
+                self._feedMarkers(frames)
+
+        self._frames_found += len(frames)
+        self._discardConsumedBytes()
+        return frames
+
+    def _feedMarkers(self, frames: List[bytes]) -> None:
+        buffer = self._buffer
+        while True:
+            if self._frame_start_index == -1:
+                start_index = buffer.find(self.SOI_MARKER, self._scan_index)
+                if start_index == -1:
+                    # The last byte may be the first half of a marker
+                    self._scan_index = max(len(buffer) - 1, 0)
+                    break
+                self._frame_start_index = start_index
+                self._scan_index = start_index + 2
+                self._in_segments = True
+                self._segment_checked_index = -1
+
+            if self._in_segments:
+                # Skip the segments before the image data by their length, so end markers of an
+                # embedded (exif) thumbnail are not mistaken for the end of the frame
+                end_index = self._skipSegments()
+                if end_index == self._SEGMENTS_INCOMPLETE:
+                    break
+                if end_index == self._SEGMENTS_INVALID:
+                    # The start marker was not the start of a frame (eg a stray 0xFFD8 in garbage data);
+                    # everything after it is still in the buffer, so look for the next start marker
+                    self._resyncs += 1
+                    self._scan_index = self._frame_start_index + 2
+                    self._frame_start_index = -1
+                    self._in_segments = False
+                    self._segment_checked_index = -1
+                    continue
+                if end_index > 0:
+                    frames.append(self._copyBytes(self._frame_start_index, end_index + 2))
+                    self._frame_start_index = -1
+                    self._scan_index = end_index + 2
+                    continue
+
+            # In the entropy coded image data 0xFF bytes are escaped, so the first end marker is the end of the frame
+            end_index = buffer.find(self.EOI_MARKER, self._scan_index)
+            if end_index == -1:
+                # Don't move back into segments that were skipped
+                self._scan_index = max(len(buffer) - 1, self._scan_index)
+                break
+
+            frames.append(self._copyBytes(self._frame_start_index, end_index + 2))
+            self._frame_start_index = -1
+            self._scan_index = end_index + 2
+
+    # Walk the segments of the frame being received, starting at the scan index.
+    # Returns _SEGMENTS_INCOMPLETE if more data is needed, 0 once the image data is reached, the index
+    # of the end marker if the frame ends before any image data, or _SEGMENTS_INVALID if the
+    # segments are not well-formed.
+    # A segment length is only trusted if the segment is followed by another marker, and if the
+    # skipped data does not hold more than one embedded image.
+    def _skipSegments(self) -> int:
+        buffer = self._buffer
+        index = self._scan_index
+        while True:
+            if index + 4 > len(buffer):
+                self._scan_index = index
+                return self._SEGMENTS_INCOMPLETE
+            if buffer[index] != 0xFF:
+                return self._SEGMENTS_INVALID
+            marker = buffer[index + 1]
+            if marker == 0xFF:  # Fill byte
+                index += 1
+                continue
+            if marker == 0xD9:
+                return index
+            if marker == 0x00 or marker == 0xD8:  # An escaped 0xFF or a start marker can not follow a segment
+                return self._SEGMENTS_INVALID
+            if 0xD0 <= marker <= 0xD7 or marker == 0x01:  # Markers without a length
+                index += 2
+                continue
+
+            length = (buffer[index + 2] << 8) | buffer[index + 3]
+            if length < 2:
+                return self._SEGMENTS_INVALID
+            segment_end_index = index + 2 + length
+            if self._segment_checked_index == -1:
+                self._segment_checked_index = index + 4
+                self._segment_images = 0
+            if not self._checkSegmentData(min(segment_end_index, len(buffer))):
+                return self._SEGMENTS_INVALID
+            if segment_end_index > len(buffer):
+                # Wait for the rest of the segment, so its data can be checked and the next marker validated
+                self._scan_index = index
+                return self._SEGMENTS_INCOMPLETE
+
+            index = segment_end_index
+            self._segment_checked_index = -1
+            if marker == 0xDA:  # Start of scan; the image data follows the header
+                break
+
+        self._in_segments = False
+        self._scan_index = index
+        return 0
+
+    # Scan the data of the segment being skipped up to end_index, continuing where the previous
+    # call stopped. An embedded thumbnail is a complete image with a start and end marker; a start
+    # marker after that means the segment length ran over the end of the frame.
+    def _checkSegmentData(self, end_index: int) -> bool:
+        buffer = self._buffer
+        index = self._segment_checked_index
+        while True:
+            marker = self.EOI_MARKER if self._segment_images == 1 else self.SOI_MARKER
+            found_index = buffer.find(marker, index, end_index)
+            if found_index == -1:
+                # The last byte may be the first half of a marker
+                self._segment_checked_index = max(end_index - 1, index)
+                return True
+            if self._segment_images == 2:
+                return False
+            self._segment_images += 1
+            index = found_index + 2
+
+    def _feedMultipart(self, frames: List[bytes]) -> None:
+        buffer = self._buffer
+        delimiter = self._delimiter
+        while True:
+            if self._frame_start_index == -1:
+                start_index = buffer.find(delimiter, self._scan_index)
+                if start_index == -1:
+                    # The end of the buffer may hold the start of a delimiter
+                    self._scan_index = max(len(buffer) - len(delimiter) + 1, self._scan_index)
+                    break
+                self._frame_start_index = start_index
+                self._scan_index = start_index + len(delimiter)
+
+            if self._body_index == -1:
+                headers_end_index = buffer.find(b"\r\n\r\n", self._scan_index)
+                if headers_end_index == -1:
+                    self._scan_index = max(len(buffer) - 3, self._scan_index)
+                    break
+                self._body_length = self._contentLength(self._copyBytes(self._frame_start_index, headers_end_index))
+                self._body_index = headers_end_index + 4
+                self._scan_index = self._body_index
+
+            if self._body_length >= 0:
+                end_index = self._body_index + self._body_length
+                if len(buffer) < end_index:
+                    break
+                frames.append(self._copyBytes(self._body_index, end_index))
+            else:
+                # Without a Content-Length the part ends where the next one starts
+                end_index = buffer.find(delimiter, self._scan_index)
+                if end_index == -1:
+                    self._scan_index = max(len(buffer) - len(delimiter) + 1, self._scan_index)
+                    break
+                body_end_index = end_index
+                if buffer[body_end_index - 2:body_end_index] == b"\r\n":
+                    body_end_index -= 2
+                frames.append(self._copyBytes(self._body_index, body_end_index))
+
+            self._frame_start_index = -1
+            self._body_index = -1
+            self._body_length = -1
+            self._scan_index = end_index
+
+    # Slicing the bytearray would copy the data once for the slice and once more for the bytes object
+    def _copyBytes(self, start_index: int, end_index: int) -> bytes:
+        # The buffer can not be resized while a memoryview of it exists, so release it right away
+        with memoryview(self._buffer) as view:
+            return bytes(view[start_index:end_index])
+
+    @staticmethod
+    def _contentLength(headers: bytes) -> int:
+        match = re.search(rb"^content-length\s*:\s*(\d+)\s*$", headers, re.IGNORECASE | re.MULTILINE)
+        return int(match.group(1)) if match else -1
+
+    ##  Abandon the frame that is being received, and continue at the next frame that starts in the buffer
+    def _resync(self) -> None:
+        self._resyncs += 1
+        marker = self._delimiter if self._delimiter else self.SOI_MARKER
+        next_index = self._buffer.find(marker, max(self._frame_start_index, 0) + 1)
+        if next_index == -1:
+            # Keep only what may be the start of a marker
+            next_index = max(len(self._buffer) - len(marker) + 1, 0)
+
+        self._frame_start_index = -1
+        self._in_segments = False
+        self._segment_checked_index = -1
+        self._body_index = -1
+        self._body_length = -1
+        self._scan_index = next_index
+        self._discardConsumedBytes()
+
+    @property
+    def resyncs(self) -> int:
+        return self._resyncs
+
+    @property
+    def bytesReceived(self) -> int:
+        return self._bytes_received
+
+    @property
+    def framesFound(self) -> int:
+        return self._frames_found
+
+    @property
+    def bufferSize(self) -> int:
+        return len(self._buffer)
+
+    # Drop the bytes before the frame that is being received (or before the scan position), so the
+    # buffer only ever holds a single partial frame
+    def _discardConsumedBytes(self) -> None:
+        consumed = self._frame_start_index if self._frame_start_index != -1 else self._scan_index
+        if consumed <= 0:
+            return
+        del self._buffer[:consumed]
+        self._scan_index -= consumed
+        if self._frame_start_index != -1:
+            self._frame_start_index -= consumed
+        if self._segment_checked_index != -1:
+            self._segment_checked_index -= consumed
+        if self._body_index != -1:
+            self._body_index -= consumed
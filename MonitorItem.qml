@@ -10,6 +10,14 @@ Component
 
     Item
     {
+        id: monitorRoot
+
+        // Printers can have multiple cameras; the focused camera is shown large, the others as thumbnails
+        property var cameras: OutputDevice != null ? OutputDevice.cameras : []
+        property int focusedCamera: 0
+        property bool otherCameraFocused: focusedCamera > 0 && focusedCamera < cameras.length
+        property var focusedOrientation: otherCameraFocused ? cameras[focusedCamera] : OutputDevice.cameraOrientation
+
         RepetierIntegration.NetworkMJPGImage
         {
             id: cameraImage
@@ -17,7 +25,7 @@ Component
 
             property real maximumWidthMinusSidebar: maximumWidth - sidebar.width - 2 * UM.Theme.getSize("default_margin").width
             property real maximumZoom: 2
-            property bool rotatedImage: (OutputDevice.cameraOrientation.rotation / 90) % 2
+            property bool rotatedImage: (monitorRoot.focusedOrientation.rotation / 90) % 2
             property bool proportionalHeight:
             {
                 if (imageHeight == 0 || maximumHeight == 0)
@@ -77,10 +85,109 @@ Component
                     stop();
                 }
             }
-            source: OutputDevice.cameraUrl
+            source: monitorRoot.otherCameraFocused ? monitorRoot.cameras[monitorRoot.focusedCamera].url : OutputDevice.cameraUrl
+            snapshotSource: monitorRoot.otherCameraFocused ? "" : OutputDevice.cameraSnapshotUrl
+            snapshotInterval: monitorRoot.otherCameraFocused ? 0 : OutputDevice.cameraSnapshotInterval
+
+            rotation: monitorRoot.focusedOrientation.rotation
+            mirror: monitorRoot.focusedOrientation.mirror
+        }
+
+        Row
+        {
+            id: cameraThumbnails
+            visible: cameraImage.visible && monitorRoot.cameras.length > 1
+            anchors.left: parent.left
+            anchors.top: parent.top
+            anchors.margins: UM.Theme.getSize("default_margin").width
+            spacing: UM.Theme.getSize("default_margin").width
+
+            Repeater
+            {
+                model: cameraThumbnails.visible ? monitorRoot.cameras : []
+                delegate: Item
+                {
+                    visible: index != monitorRoot.focusedCamera
+                    width: 160 * screenScaleFactor
+                    height:
+                    {
+                        if (cameraThumbnail.imageWidth == 0 || cameraThumbnail.imageHeight == 0)
+                        {
+                            return width * 3 / 4;
+                        }
+                        if (cameraThumbnail.rotatedImage)
+                        {
+                            return width * cameraThumbnail.imageWidth / cameraThumbnail.imageHeight;
+                        }
+                        return width * cameraThumbnail.imageHeight / cameraThumbnail.imageWidth;
+                    }
+
+                    RepetierIntegration.NetworkMJPGImage
+                    {
+                        id: cameraThumbnail
+
+                        // The image is rotated around its center, so it is sized as it is before rotating
+                        property bool rotatedImage: (modelData.rotation / 90) % 2
+                        anchors.centerIn: parent
+                        width: rotatedImage ? parent.height : parent.width
+                        height: rotatedImage ? parent.width : parent.height
+                        rotation: modelData.rotation
+                        mirror: modelData.mirror
+
+                        // Thumbnails don't need every frame; they show snapshots, which are taken from
+                        // the stream if the camera does not provide a snapshot url
+                        background: true
+                        source: modelData.url
+                        snapshotSource: modelData.snapshotUrl
+                        snapshotInterval: 2000
+
+                        Component.onCompleted:
+                        {
+                            if (visible)
+                            {
+                                start();
+                            }
+                        }
+                        onVisibleChanged:
+                        {
+                            if (visible)
+                            {
+                                start();
+                            } else
+                            {
+                                stop();
+                            }
+                        }
+                    }
+
+                    MouseArea
+                    {
+                        anchors.fill: parent
+                        onClicked: monitorRoot.focusedCamera = index
+                    }
+                }
+            }
+        }
+
+        Text
+        {
+            id: cameraMetrics
+            visible: cameraImage.visible && UM.Preferences.getValue("Repetier/show_camera_metrics")
+            anchors.left: cameraImage.left
+            anchors.top: cameraImage.top
+            anchors.margins: UM.Theme.getSize("default_margin").width
 
-            rotation: OutputDevice.cameraOrientation.rotation
-            mirror: OutputDevice.cameraOrientation.mirror
+            color: "white"
+            style: Text.Outline
+            styleColor: "black"
+            font: UM.Theme.getFont("default")
+            text:
+            {
+                return "received: %1 fps, %2 kB/s\n".arg(cameraImage.receivedFps.toFixed(1)).arg((cameraImage.bytesPerSecond / 1000).toFixed(0)) +
+                    "displayed: %1 fps, %2 dropped\n".arg(cameraImage.displayedFps.toFixed(1)).arg(cameraImage.droppedFrames) +
+                    "decode: %1 ms avg, %2 ms max\n".arg(cameraImage.averageDecodeMs.toFixed(1)).arg(cameraImage.maximumDecodeMs.toFixed(1)) +
+                    "frame age: %1 ms".arg(cameraImage.frameAgeMs.toFixed(0));
+            }
         }
 
         Item
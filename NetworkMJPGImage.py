@@ -1,35 +1,49 @@
 # Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
 # NetworkMJPGImage is released under the terms of the LGPLv3 or higher.
 
-from PyQt5.QtCore import QUrl, pyqtProperty, pyqtSignal, pyqtSlot, QRect, QByteArray
-from PyQt5.QtGui import QImage, QPainter
-from PyQt5.QtQuick import QQuickPaintedItem
-from PyQt5.QtNetwork import QNetworkRequest, QNetworkReply, QNetworkAccessManager
+from PyQt5.QtCore import QUrl, pyqtProperty, pyqtSignal, pyqtSlot, QRectF, QSize
+from PyQt5.QtGui import QImage, QPainter, QWindow
+from PyQt5.QtQuick import QQuickPaintedItem, QQuickWindow
 
+from UM.Application import Application
 from UM.Logger import Logger
 
+from .MJPEGStream import MJPEGStream
+
+from typing import Optional
+
+#
+# A QQuickPaintedItem that shows a network mjpeg stream (or periodic jpeg snapshots).
 #
-# A QQuickPaintedItem that progressively downloads a network mjpeg stream,
-# picks it apart in individual jpeg frames, and paints it.
+# Views of the same camera share a single MJPEGStream, and with it a single connection and decoded
+# frame. The stream is paused while the window is minimized or the Monitor stage is not active.
 #
 class NetworkMJPGImage(QQuickPaintedItem):
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
-        self._stream_buffer = QByteArray()
-        self._stream_buffer_start_index = -1
-        self._network_manager = None  # type: QNetworkAccessManager
-        self._image_request = None  # type: QNetworkRequest
-        self._image_reply = None  # type: QNetworkReply
+        self._stream = None  # type: Optional[MJPEGStream]
         self._image = QImage()
-        self._image_rect = QRect()
+        self._source_size = QSize()
 
         self._source_url = QUrl()
         self._started = False
 
         self._mirror = False
 
+        self._snapshot_url = QUrl()
+        self._snapshot_interval = 0
+
+        self._background = False
+
+        self._window = None  # type: Optional[QQuickWindow]
+        self.windowChanged.connect(self._onWindowChanged)
+        try:
+            Application.getInstance().getController().activeStageChanged.connect(self._updatePaused)
+        except AttributeError:
+            pass  # Not running inside Cura
+
         self.setAntialiasing(True)
 
     ##  Ensure that close gets called when object is destroyed
@@ -38,12 +52,14 @@ class NetworkMJPGImage(QQuickPaintedItem):
 
 
     def paint(self, painter: "QPainter") -> None:
-        if self._mirror:
-            painter.drawImage(self.contentsBoundingRect(), self._image.mirrored())
-            return
-
+        # Frames are mirrored when they are decoded; rotation is applied to the item in QML
         painter.drawImage(self.contentsBoundingRect(), self._image)
 
+    def geometryChanged(self, new_geometry: QRectF, old_geometry: QRectF) -> None:
+        super().geometryChanged(new_geometry, old_geometry)
+        if self._stream:
+            self._stream.setTargetSize(self, self._getTargetSize())
+
 
     def setSourceURL(self, source_url: "QUrl") -> None:
         self._source_url = source_url
@@ -61,8 +77,9 @@ class NetworkMJPGImage(QQuickPaintedItem):
         if mirror == self._mirror:
             return
         self._mirror = mirror
+        if self._stream:
+            self._stream.setMirror(mirror)
         self.mirrorChanged.emit()
-        self.update()
 
     def getMirror(self) -> bool:
         return self._mirror
@@ -70,84 +87,185 @@ class NetworkMJPGImage(QQuickPaintedItem):
     mirrorChanged = pyqtSignal()
     mirror = pyqtProperty(bool, fget = getMirror, fset = setMirror, notify = mirrorChanged)
 
+    def setSnapshotURL(self, snapshot_url: "QUrl") -> None:
+        if snapshot_url == self._snapshot_url:
+            return
+        self._snapshot_url = snapshot_url
+        self.snapshotURLChanged.emit()
+        if self._started and self._snapshot_interval > 0:
+            self.start()
+
+    def getSnapshotURL(self) -> "QUrl":
+        return self._snapshot_url
+
+    snapshotURLChanged = pyqtSignal()
+    snapshotSource = pyqtProperty(QUrl, fget = getSnapshotURL, fset = setSnapshotURL, notify = snapshotURLChanged)
+
+    def setSnapshotInterval(self, snapshot_interval: int) -> None:
+        if snapshot_interval == self._snapshot_interval:
+            return
+        self._snapshot_interval = snapshot_interval
+        self.snapshotIntervalChanged.emit()
+        if self._started:
+            self.start()
+
+    def getSnapshotInterval(self) -> int:
+        return self._snapshot_interval
+
+    snapshotIntervalChanged = pyqtSignal()
+    snapshotInterval = pyqtProperty(int, fget = getSnapshotInterval, fset = setSnapshotInterval, notify = snapshotIntervalChanged)
+
+    ##  Background views (such as thumbnails of cameras that are not in focus) don't need every frame;
+    #   frames of streams that are only shown in background views are decoded with low priority.
+    def setBackground(self, background: bool) -> None:
+        if background == self._background:
+            return
+        self._background = background
+        if self._stream:
+            self._stream.setBackground(self, background)
+        self.backgroundChanged.emit()
+
+    def getBackground(self) -> bool:
+        return self._background
+
+    backgroundChanged = pyqtSignal()
+    background = pyqtProperty(bool, fget = getBackground, fset = setBackground, notify = backgroundChanged)
+
     imageSizeChanged = pyqtSignal()
+    frameCountsChanged = pyqtSignal()
 
     @pyqtProperty(int, notify = imageSizeChanged)
     def imageWidth(self) -> int:
-        return self._image.width()
+        return self._source_size.width() if self._source_size.isValid() else 0
 
     @pyqtProperty(int, notify = imageSizeChanged)
     def imageHeight(self) -> int:
-        return self._image.height()
+        return self._source_size.height() if self._source_size.isValid() else 0
+
+
+    @pyqtProperty(int, notify = frameCountsChanged)
+    def decodedFrames(self) -> int:
+        return self._stream.decodedFrames if self._stream else 0
+
+    @pyqtProperty(int, notify = frameCountsChanged)
+    def droppedFrames(self) -> int:
+        return self._stream.droppedFrames if self._stream else 0
+
+    # Number of times the stream parser had to skip ahead because a frame exceeded the buffer size
+    @pyqtProperty(int, notify = frameCountsChanged)
+    def streamResyncs(self) -> int:
+        return self._stream.streamResyncs if self._stream else 0
+
+    metricsChanged = pyqtSignal()
+
+    # Frames per second received from the camera
+    @pyqtProperty(float, notify = metricsChanged)
+    def receivedFps(self) -> float:
+        return self._stream.getMetrics().receivedFps if self._stream else 0.0
+
+    # Frames per second that were decoded and displayed
+    @pyqtProperty(float, notify = metricsChanged)
+    def displayedFps(self) -> float:
+        return self._stream.getMetrics().displayedFps if self._stream else 0.0
+
+    @pyqtProperty(float, notify = metricsChanged)
+    def bytesPerSecond(self) -> float:
+        return self._stream.getMetrics().bytesPerSecond if self._stream else 0.0
+
+    @pyqtProperty(float, notify = metricsChanged)
+    def averageDecodeMs(self) -> float:
+        return self._stream.getMetrics().averageDecodeTime * 1000 if self._stream else 0.0
+
+    @pyqtProperty(float, notify = metricsChanged)
+    def maximumDecodeMs(self) -> float:
+        return self._stream.getMetrics().maximumDecodeTime * 1000 if self._stream else 0.0
+
+    # Time since the displayed frame was received, in ms
+    @pyqtProperty(float, notify = metricsChanged)
+    def frameAgeMs(self) -> float:
+        return self._stream.getMetrics().frameAge * 1000 if self._stream else 0.0
 
 
     @pyqtSlot()
     def start(self) -> None:
-        self.stop()  # Ensure that previous requests (if any) are stopped.
+        self.stop()  # Ensure that previous streams (if any) are stopped.
 
-        if not self._source_url:
+        if not self._source_url.isValid() and not (self._snapshot_interval > 0 and self._snapshot_url.isValid()):
             Logger.log("w", "Unable to start camera stream without target!")
             return
         self._started = True
-        Logger.log("w", "MJPEG starting stream...")
-        self._image_request = QNetworkRequest(self._source_url)
-        if self._network_manager is None:
-            self._network_manager = QNetworkAccessManager()
 
-        self._image_reply = self._network_manager.get(self._image_request)
-        self._image_reply.downloadProgress.connect(self._onStreamDownloadProgress)
+        self._stream = MJPEGStream.getStream(self._source_url, self._snapshot_url, self._snapshot_interval)
+        self._stream.frameChanged.connect(self._onFrameChanged)
+        self._stream.sourceSizeChanged.connect(self._onSourceSizeChanged)
+        self._stream.frameCountsChanged.connect(self.frameCountsChanged)
+        self._stream.metricsChanged.connect(self.metricsChanged)
+        self._stream.setMirror(self._mirror)
+        self._stream.setTargetSize(self, self._getTargetSize())
+        self._stream.setBackground(self, self._background)
+        self._stream.subscribe(self, self._isPaused())
+
+        # Show the last frame of the stream (if any) until a new frame arrives
+        self._onSourceSizeChanged()
+        self._onFrameChanged()
 
     @pyqtSlot()
     def stop(self) -> None:
-        Logger.log("w", "MJPEG stopping stream...")	
-        self._stream_buffer = QByteArray()
-        self._stream_buffer_start_index = -1
-
-        if self._image_reply:
+        if self._stream:
             try:
-                try:
-                    self._image_reply.downloadProgress.disconnect(self._onStreamDownloadProgress)
-                except Exception:
-                    pass
-
-                if not self._image_reply.isFinished():
-                    self._image_reply.close()
-            except Exception as e:  # RuntimeError
+                self._stream.frameChanged.disconnect(self._onFrameChanged)
+                self._stream.sourceSizeChanged.disconnect(self._onSourceSizeChanged)
+                self._stream.frameCountsChanged.disconnect(self.frameCountsChanged)
+                self._stream.metricsChanged.disconnect(self.metricsChanged)
+            except (TypeError, RuntimeError):
                 pass  # It can happen that the wrapped c++ object is already deleted.
-
-            self._image_reply = None
-            self._image_request = None
-
-        self._network_manager = None
+            self._stream.unsubscribe(self)
+            self._stream = None
 
         self._started = False
 
+    def _onFrameChanged(self) -> None:
+        if not self._stream:
+            return
+        self._image = self._stream.getImage()
+        self.update()
 
-    def _onStreamDownloadProgress(self, bytes_received: int, bytes_total: int) -> None:
-        # An MJPG stream is (for our purpose) a stream of concatenated JPG images.
-        # JPG images start with the marker 0xFFD8, and end with 0xFFD9
-        if self._image_reply is None:
+    def _onSourceSizeChanged(self) -> None:
+        if not self._stream:
             return
-        self._stream_buffer += self._image_reply.readAll()
-#        if len(self._stream_buffer) > 2000000:  # No single camera frame should be 2 Mb or larger
-#            Logger.log("w", "MJPEG buffer exceeds reasonable size. Restarting stream...%d",len(self._stream_buffer))
-#            self.stop()  # resets stream buffer and start index
-#            self.start()
-#            return
-
-        if self._stream_buffer_start_index == -1:
-            self._stream_buffer_start_index = self._stream_buffer.indexOf(b'\xff\xd8')
-        stream_buffer_end_index = self._stream_buffer.lastIndexOf(b'\xff\xd9')
-        # If this happens to be more than a single frame, then so be it; the JPG decoder will
-        # ignore the extra data. We do it like this in order not to get a buildup of frames
-
-        if self._stream_buffer_start_index != -1 and stream_buffer_end_index != -1:
-            jpg_data = self._stream_buffer[self._stream_buffer_start_index:stream_buffer_end_index + 2]
-            self._stream_buffer = self._stream_buffer[stream_buffer_end_index + 2:]
-            self._stream_buffer_start_index = -1
-            self._image.loadFromData(jpg_data)
-
-            if self._image.rect() != self._image_rect:
-                self.imageSizeChanged.emit()
-
-            self.update()
+        if self._stream.getSourceSize() != self._source_size:
+            self._source_size = self._stream.getSourceSize()
+            self.imageSizeChanged.emit()
+
+    def _onWindowChanged(self, window: Optional[QQuickWindow]) -> None:
+        if self._window:
+            try:
+                self._window.visibilityChanged.disconnect(self._updatePaused)
+            except (TypeError, RuntimeError):
+                pass
+        self._window = window
+        if self._window:
+            self._window.visibilityChanged.connect(self._updatePaused)
+        self._updatePaused()
+
+    ##  The stream is not needed while the window is minimized or the Monitor stage is not active
+    def _isPaused(self) -> bool:
+        if self._window and self._window.visibility() in (QWindow.Minimized, QWindow.Hidden):
+            return True
+        try:
+            active_stage = Application.getInstance().getController().getActiveStage()
+        except AttributeError:
+            return False
+        return active_stage is not None and active_stage.getPluginId() != "MonitorStage"
+
+    def _updatePaused(self, *args) -> None:
+        if self._stream:
+            self._stream.setPaused(self, self._isPaused())
+
+    ##  The size in device pixels that the frames are displayed at
+    def _getTargetSize(self) -> QSize:
+        device_pixel_ratio = self.window().devicePixelRatio() if self.window() else 1.0
+        return QSize(
+            int(self.width() * device_pixel_ratio),
+            int(self.height() * device_pixel_ratio)
+        )
@@ -8,6 +8,7 @@ from UM.Message import Message
 from UM.Util import parseBool
 from UM.Mesh.MeshWriter import MeshWriter
 from UM.PluginRegistry import PluginRegistry
+from UM.Resources import Resources
 
 from cura.CuraApplication import CuraApplication
 
@@ -18,8 +19,13 @@ from cura.PrinterOutput.Models.PrintJobOutputModel import PrintJobOutputModel
 
 from cura.PrinterOutput.GenericOutputController import GenericOutputController
 
+from .TimelapseRecorder import TimelapseRecorder
+from .GcodeCoalescer import coalesceGcode
+from .ControlNetworkManager import ControlNetworkManager
+from .RepetierRequestFactory import RepetierRequestFactory
+
 from PyQt5.QtNetwork import QHttpMultiPart, QHttpPart, QNetworkRequest, QNetworkAccessManager
-from PyQt5.QtNetwork import QNetworkReply, QSslConfiguration, QSslSocket
+from PyQt5.QtNetwork import QNetworkReply
 from PyQt5.QtCore import QUrl, QTimer, pyqtSignal, pyqtProperty, pyqtSlot, QCoreApplication
 from PyQt5.QtGui import QImage, QDesktopServices
 
@@ -102,7 +108,6 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
         self._job_prefix = "printer/job/" + self._repetier_id
         self._save_prefix = "printer/model/" + self._repetier_id
         self._api_header = "x-api-key".encode()
-        self._api_key = b""
 
         self._protocol = "https" if properties.get(b'useHttps') == b"true" else "http"
         self._base_url = "%s://%s:%d%s" % (self._protocol, self._address, self._port, self._path)
@@ -118,6 +123,8 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
             data = base64.b64encode(("%s:%s" % (basic_auth_username, basic_auth_password)).encode()).decode("utf-8")
             self._basic_auth_data = ("basic %s" % data).encode()
 
+        self._request_factory = RepetierRequestFactory(self._api_url, self._job_url, self._save_url, self._user_agent, self._basic_auth_data)
+
         self._monitor_view_qml_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MonitorItem.qml")
 
         name = self._id
@@ -135,13 +142,23 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
 
         self._post_reply = None
 
+        # Control commands (pause, cancel, gcode) get their own network manager, so they have their
+        # own connection to Repetier and never queue behind status polls or an upload
+        self._control_manager = None  # type: Optional[ControlNetworkManager]
+
         self._progress_message = None # type: Union[None, Message]
         self._error_message = None # type: Union[None, Message]
         self._connection_message = None # type: Union[None, Message]
 
+        # Gcode commands sent within the batch window are sent to Repetier as a single request
+        try:
+            batch_window = int(CuraApplication.getInstance().getPreferences().getValue("Repetier/gcode_batch_window"))
+        except (TypeError, ValueError):
+            batch_window = 50
         self._queued_gcode_commands = [] # type: List[str]
+        self._queued_gcode_time = None # type: Optional[float]
         self._queued_gcode_timer = QTimer()
-        self._queued_gcode_timer.setInterval(0)
+        self._queued_gcode_timer.setInterval(max(batch_window, 0))
         self._queued_gcode_timer.setSingleShot(True)
         self._queued_gcode_timer.timeout.connect(self._sendQueuedGcode)
 
@@ -150,11 +167,25 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
         self._update_timer.setSingleShot(False)
         self._update_timer.timeout.connect(self._update)
 
+        # Elapsed time is extrapolated locally between status updates so the progress display stays fluid
+        self._progress_timer = QTimer()
+        self._progress_timer.setInterval(500)
+        self._progress_timer.setSingleShot(False)
+        self._progress_timer.timeout.connect(self._interpolateProgress)
+        self._progress_sample_time = None  # type: Optional[float]
+        self._progress_sample_elapsed = 0.0
+        self._progress_rate = 1.0
+
         self._show_camera = True
         self._camera_mirror = False
         self._camera_rotation = 0
         self._camera_url = ""
+        self._camera_snapshot_url = ""
+        self._camera_snapshot_interval = 0
         self._camera_shares_proxy = False
+        self._cameras = []  # type: List[Dict[str, Any]]
+
+        self._timelapse_recorder = TimelapseRecorder()
 
         self._sd_supported = False
 
@@ -181,7 +212,7 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
 
     #  Set the API key of this Repetier instance
     def setApiKey(self, api_key: str) -> None:
-        self._api_key = api_key.encode()
+        self._request_factory.setApiKey(api_key)
 
     #  Name of the instance (as returned from the zeroConf properties)
     @pyqtProperty(str, constant = True)
@@ -247,6 +278,22 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
     def cameraUrl(self) -> QUrl:
         return QUrl(self._camera_url)
 
+    @pyqtProperty("QUrl", notify = cameraUrlChanged)
+    def cameraSnapshotUrl(self) -> QUrl:
+        return QUrl(self._camera_snapshot_url)
+
+    #  Interval in ms at which camera snapshots are shown instead of the camera stream, or 0 to show the stream
+    @pyqtProperty(int, notify = cameraUrlChanged)
+    def cameraSnapshotInterval(self) -> int:
+        return self._camera_snapshot_interval
+
+    camerasChanged = pyqtSignal()
+
+    #  All cameras of the printer, with their stream url, snapshot url (if any) and orientation
+    @pyqtProperty("QVariantList", notify = camerasChanged)
+    def cameras(self) -> List[Dict[str, Any]]:
+        return self._cameras
+
     def setShowCamera(self, show_camera: bool) -> None:
         if show_camera != self._show_camera:
             self._show_camera = show_camera
@@ -259,6 +306,10 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
         return self._show_camera
 
     def _update(self) -> None:
+        # Keep the connection for control commands open, so they don't have to wait for it to be reopened
+        if self._control_manager:
+            self._control_manager.warmUp()
+
         # Request 'general' printer data
         self.get("stateList", self._onRequestFinished)
         # Request print_job data
@@ -275,6 +326,8 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
         if self._error_message:
             self._error_message.hide()
         self._update_timer.stop()
+        self._stopProgressInterpolation()
+        self._timelapse_recorder.stop()
 
     def requestWrite(self, nodes: List["SceneNode"], file_name: Optional[str] = None, limit_mimetypes: bool = False, file_handler: Optional["FileHandler"] = None, **kwargs: str) -> None:
         self.writeStarted.emit(self)
@@ -492,40 +545,96 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
             self._progress_message.hide()
 
     def sendCommand(self, command: str) -> None:
+        if command.split(";", 1)[0].strip().upper() in self._immediate_gcode_commands:
+            # Safety critical commands are never queued or merged
+            if command.split(";", 1)[0].strip().upper() == "M112" and self._queued_gcode_commands:
+                Logger.log("d", "Emergency stop discards %d queued gcode command(s)", len(self._queued_gcode_commands))
+                self._queued_gcode_commands = []
+                self._queued_gcode_time = None
+                self._queued_gcode_timer.stop()
+            self._sendCommandToApi("send", "&data=" + json.dumps({"cmd": command}))
+            Logger.log("d", "Sent gcode command to Repetier instance: %s", command)
+            return
+
+        if not self._queued_gcode_commands:
+            self._queued_gcode_time = time()
         self._queued_gcode_commands.append(command)
-        CuraApplication.getInstance().callLater(self._sendQueuedGcode)
+        if not self._queued_gcode_timer.isActive():
+            self._queued_gcode_timer.start()
+
+    _immediate_gcode_commands = {"M108", "M112", "M410"}
 
     # Send gcode commands that are queued in quick succession as a single batch
     def _sendQueuedGcode(self) -> None:
-        if self._queued_gcode_commands:
-            for gcode in self._queued_gcode_commands:
-                self._sendCommandToApi("send", "&data={\"cmd\":\"" + gcode + "\"}")
-                Logger.log("d", "Sent gcode command to Repetier instance: %s", gcode)
-            self._queued_gcode_commands = []
+        if not self._queued_gcode_commands:
+            return
+
+        queued_count = len(self._queued_gcode_commands)
+        commands = coalesceGcode(self._queued_gcode_commands)
+        queued_time = self._queued_gcode_time
+        self._queued_gcode_commands = []
+        self._queued_gcode_time = None
+
+        # Repetier executes the lines of a single send command in order
+        self._sendCommandToApi("send", "&data=" + json.dumps({"cmd": "\n".join(commands)}),
+            on_finished = lambda reply: self._onQueuedGcodeFinished(reply, len(commands), queued_time))
+        Logger.log("d", "Sent %d gcode command(s) to Repetier instance (%d superseded): %s", len(commands), queued_count - len(commands), ", ".join(commands))
+
+    def _onQueuedGcodeFinished(self, reply: QNetworkReply, command_count: int, queued_time: Optional[float]) -> None:
+        if queued_time is None:
+            return
+        Logger.log("d", "Batch of %d gcode command(s) acknowledged after %d ms, saving %d request(s)",
+            command_count, (time() - queued_time) * 1000, command_count - 1)
 
     def _sendJobCommand(self, command: str) -> None:
         #Logger.log("d", "sendJobCommand: %s", command)
         if (command=="pause"):
             self._sendCommandToApi("send", "&data={\"cmd\":\"@pause\"}")
         if (command=="start"):
-            self._manager.get(self._createEmptyRequest("continueJob"))
+            self._sendControlRequest("continueJob")
         if (command=="cancel"):
-            self._manager.get(self._createEmptyRequest("stopJob"))
+            self._sendControlRequest("stopJob")
         #Logger.log("d", "Sent job command to Repetier instance: %s %s" % (command,self.jobState))
 
-    def _sendCommandToApi(self, end_point, commands):        
-        command_request = QNetworkRequest(QUrl(self._api_url + "?a=" + end_point))
-        command_request.setRawHeader(self._user_agent_header, self._user_agent.encode())
-        command_request.setRawHeader(self._api_header, self._api_key)
-        if self._basic_auth_data:
-            command_request.setRawHeader(self._basic_auth_header, self._basic_auth_data)                
-        command_request.setHeader(QNetworkRequest.ContentTypeHeader, "application/json")
+    def _sendCommandToApi(self, end_point, commands, on_finished: Optional[Callable[[QNetworkReply], None]] = None):
+        command_request = self._createEmptyRequest(end_point)
         if isinstance(commands, list):
             data = json.dumps({"commands": commands})
         else:
             data = commands
         #Logger.log("d", "_sendCommandToAPI: %s", data)
-        self._command_reply = self._manager.post(command_request, data.encode())
+        command_request.setPriority(QNetworkRequest.HighPriority)
+        reply = self._getControlManager().post(command_request, data.encode())
+        self._command_reply = reply
+        if on_finished is not None:
+            # Callbacks registered with _registerOnFinishedCallback are kept per url, so they would
+            # also be called for later commands sent to the same end point
+            reply.finished.connect(lambda: on_finished(reply))
+
+    def _sendControlRequest(self, target: str) -> None:
+        request = self._createEmptyRequest(target)
+        request.setPriority(QNetworkRequest.HighPriority)
+        self._getControlManager().get(request)
+
+    def _getControlManager(self) -> ControlNetworkManager:
+        if self._control_manager is None:
+            self._createControlManager()
+        return self._control_manager
+
+    ##  Overloaded from NetworkedPrinterOutputDevice to also (re)create the network manager for control commands
+    def _createNetworkManager(self) -> None:
+        super()._createNetworkManager()
+        self._createControlManager()
+
+    def _createControlManager(self) -> None:
+        if self._control_manager:
+            self._control_manager.finished.disconnect(self._handleOnFinished)
+            self._control_manager.authenticationRequired.disconnect(self._onAuthenticationRequired)
+        # The manager opens the connection up front, so the first control command does not have to wait for it
+        ssl_configuration = self._request_factory.getTemplate().sslConfiguration() if self._protocol == "https" else None
+        self._control_manager = ControlNetworkManager(self._address, self._port, ssl_configuration)
+        self._control_manager.finished.connect(self._handleOnFinished)
+        self._control_manager.authenticationRequired.connect(self._onAuthenticationRequired)
 
         #  Handler for all requests that have finished.
     def _onRequestFinished(self, reply: QNetworkReply) -> None:
@@ -688,6 +797,13 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
                                 if json_data[self._printerindex(json_data,self._repetier_id)]["paused"] != False:
                                     print_job_state = "paused"                                                                
                             print_job.updateState(print_job_state)                                
+                            if print_job_state != "printing":
+                                self._stopProgressInterpolation()
+                            try:
+                                self._updateTimelapse(print_job_state, print_job.name)
+                            except Exception:
+                                # Problems with the recording should not look like problems with the printer
+                                Logger.logException("w", "Could not update the timelapse recording")
                             if "done" in json_data[self._printerindex(json_data,self._repetier_id)]:
                                 progress = json_data[self._printerindex(json_data,self._repetier_id)]["done"]
                             if "start" in json_data[self._printerindex(json_data,self._repetier_id)]:
@@ -696,6 +812,8 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
                                         print_job.updateTimeTotal(json_data[self._printerindex(json_data,self._repetier_id)]["printTime"])
                                     if json_data[self._printerindex(json_data,self._repetier_id)]["printedTimeComp"]:
                                         print_job.updateTimeElapsed(json_data[self._printerindex(json_data,self._repetier_id)]["printedTimeComp"])
+                                        if print_job_state == "printing":
+                                            self._updateProgressSample(json_data[self._printerindex(json_data,self._repetier_id)]["printedTimeComp"])
                                     elif progress > 0:
                                         print_job.updateTimeTotal(json_data[self._printerindex(json_data,self._repetier_id)]["printTime"] * (progress / 100))
                                     else:
@@ -723,76 +841,14 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
 
                     if "webcam" in json_data and "dynamicUrl" in json_data["webcam"]:
                         Logger.log("d", "RepetierOutputDevice: Detected Repetier 89.X")
-                        self._camera_shares_proxy = False
-                        Logger.log("d", "RepetierOutputDevice: Checking streamurl")                        
-                        stream_url = json_data["webcam"]["dynamicUrl"].replace("127.0.0.1",self._address)
-                        if not stream_url: #empty string or None
-                            self._camera_url = ""
-                        elif stream_url[:4].lower() == "http": # absolute uri                        Logger.log("d", "RepetierOutputDevice: stream_url: %s",stream_url)
-                            self._camera_url=stream_url
-                        elif stream_url[:2] == "//": # protocol-relative
-                            self._camera_url = "%s:%s" % (self._protocol, stream_url)
-                        elif stream_url[:1] == ":": # domain-relative (on another port)
-                            self._camera_url = "%s://%s%s" % (self._protocol, self._address, stream_url)
-                        elif stream_url[:1] == "/": # domain-relative (on same port)
-                            self._camera_url = "%s://%s:%d%s" % (self._protocol, self._address, self._port, stream_url)
-                            self._camera_shares_proxy = True
-                        else:
-                            Logger.log("w", "Unusable stream url received: %s", stream_url)
-                            self._camera_url = ""
-                        if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamflip_y", False)):
-                            self._camera_mirror = True
-                        else:
-                            self._camera_mirror = False
-                        if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamflip_x", False)):
-                            self._camera_rotation = 180
-                            self._camera_mirror = True
-                        if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamrot_90", False)):
-                            self._camera_rotation = 90
-                        if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamrot_180", False)):
-                            self._camera_rotation = 180
-                        if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamrot_270", False)):
-                            self._camera_rotation = 270
-                        Logger.log("d", "Set Repetier camera url to %s", self._camera_url)
-                        self.cameraUrlChanged.emit()
-                        self._camera_mirror = False
-                        #self.cameraOrientationChanged.emit()
+                        self._updateMonitorCamera(json_data["webcam"], global_container_stack)
+                        self._updateCameras([json_data["webcam"]], global_container_stack)
                     if "webcams" in json_data:
                         Logger.log("d", "RepetierOutputDevice: Detected Repetier 90.X")
+                        self._updateCameras(json_data["webcams"], global_container_stack)
                         if len(json_data["webcams"])>0:
                             if "dynamicUrl" in json_data["webcams"][0]:
-                                self._camera_shares_proxy = False
-                                Logger.log("d", "RepetierOutputDevice: Checking streamurl")                        
-                                stream_url = json_data["webcams"][0]["dynamicUrl"].replace("127.0.0.1",self._address)
-                                if not stream_url: #empty string or None
-                                    self._camera_url = ""
-                                elif stream_url[:4].lower() == "http": # absolute uri                        Logger.log("d", "RepetierOutputDevice: stream_url: %s",stream_url)
-                                    self._camera_url=stream_url
-                                elif stream_url[:2] == "//": # protocol-relative
-                                    self._camera_url = "%s:%s" % (self._protocol, stream_url)
-                                elif stream_url[:1] == ":": # domain-relative (on another port)
-                                    self._camera_url = "%s://%s%s" % (self._protocol, self._address, stream_url)
-                                elif stream_url[:1] == "/": # domain-relative (on same port)
-                                    self._camera_url = "%s://%s:%d%s" % (self._protocol, self._address, self._port, stream_url)
-                                    self._camera_shares_proxy = True
-                                else:
-                                    Logger.log("w", "Unusable stream url received: %s", stream_url)
-                                    self._camera_url = ""
-                                Logger.log("d", "Set Repetier camera url to %s", self._camera_url)
-                                if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamflip_y", False)):
-                                    self._camera_mirror = True
-                                else:
-                                    self._camera_mirror = False
-                                if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamflip_x", False)):
-                                    self._camera_rotation = 180
-                                    self._camera_mirror = True
-                                if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamrot_90", False)):
-                                    self._camera_rotation = 90
-                                if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamrot_180", False)):
-                                    self._camera_rotation = 180
-                                if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamrot_270", False)):
-                                    self._camera_rotation = 270                                
-                                self.cameraUrlChanged.emit()
+                                self._updateMonitorCamera(json_data["webcams"][0], global_container_stack)
         elif reply.operation() == QNetworkAccessManager.PostOperation:
             if self._api_prefix + "?a=listModels" in reply.url().toString():  # Result from /files command:
                 if http_status_code == 201:
@@ -837,6 +893,79 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
             self._error_message = Message(error_string, title=i18n_catalog.i18nc("@label", "Repetier error"))
             self._error_message.show()
             return
+
+    #  Use the first webcam in the monitor view, oriented as set for that camera
+    def _updateMonitorCamera(self, webcam_data: Dict[str, Any], global_container_stack: Any) -> None:
+        camera_urls = self._getCameraUrls(webcam_data)
+        self._camera_url = camera_urls["url"]
+        self._camera_snapshot_url = camera_urls["snapshotUrl"]
+        # Streams on the same port as Repetier-Server are served through its proxy
+        stream_url = webcam_data.get("dynamicUrl") or ""
+        self._camera_shares_proxy = stream_url[:1] == "/" and stream_url[:2] != "//"
+        Logger.log("d", "Set Repetier camera url to %s, snapshot url to %s", self._camera_url, self._camera_snapshot_url)
+
+        self._camera_snapshot_interval = 0
+        if self._camera_snapshot_url and parseBool(global_container_stack.getMetaDataEntry("repetier_camera_snapshots", False)):
+            try:
+                self._camera_snapshot_interval = max(int(global_container_stack.getMetaDataEntry("repetier_camera_snapshot_interval", 1000)), 100)
+            except ValueError:
+                self._camera_snapshot_interval = 1000
+
+        orientation = self._getCameraOrientation(0, global_container_stack)
+        if orientation["mirror"] != self._camera_mirror or orientation["rotation"] != self._camera_rotation:
+            self._camera_mirror = orientation["mirror"]
+            self._camera_rotation = orientation["rotation"]
+            self.cameraOrientationChanged.emit()
+
+        self.cameraUrlChanged.emit()
+
+    #  The absolute urls of the stream ("url") and of the snapshots ("snapshotUrl") of a webcam
+    def _getCameraUrls(self, webcam_data: Dict[str, Any]) -> Dict[str, str]:
+        return {
+            "url": self._getAbsoluteCameraUrl(webcam_data.get("dynamicUrl") or ""),
+            "snapshotUrl": self._getAbsoluteCameraUrl(webcam_data.get("staticUrl") or "")
+        }
+
+    def _getAbsoluteCameraUrl(self, camera_url: str) -> str:
+        camera_url = camera_url.replace("127.0.0.1",self._address)
+        if not camera_url:
+            return ""
+        elif camera_url[:4].lower() == "http": # absolute uri
+            return camera_url
+        elif camera_url[:2] == "//": # protocol-relative
+            return "%s:%s" % (self._protocol, camera_url)
+        elif camera_url[:1] == ":": # domain-relative (on another port)
+            return "%s://%s%s" % (self._protocol, self._address, camera_url)
+        elif camera_url[:1] == "/": # domain-relative (on same port)
+            return "%s://%s:%d%s" % (self._protocol, self._address, self._port, camera_url)
+        Logger.log("w", "Unusable camera url received: %s", camera_url)
+        return ""
+
+    def _updateCameras(self, webcams_data: List[Dict[str, Any]], global_container_stack: Any) -> None:
+        cameras = []  # type: List[Dict[str, Any]]
+        for index, webcam_data in enumerate(webcams_data):
+            camera = self._getCameraUrls(webcam_data)  # type: Dict[str, Any]
+            if camera["url"]:
+                camera.update(self._getCameraOrientation(index, global_container_stack))
+                cameras.append(camera)
+        if cameras != self._cameras:
+            self._cameras = cameras
+            self.camerasChanged.emit()
+
+    #  The orientation of the first camera is stored in the repetier_webcamflip_* and repetier_webcamrot_*
+    #  metadata entries, that of further cameras in the same entries suffixed with the index of the camera
+    def _getCameraOrientation(self, index: int, global_container_stack: Any) -> Dict[str, Any]:
+        suffix = "_%d" % index if index > 0 else ""
+        mirror = parseBool(global_container_stack.getMetaDataEntry("repetier_webcamflip_y" + suffix, False))
+        rotation = 0
+        if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamflip_x" + suffix, False)):
+            rotation = 180
+            mirror = True
+        for angle in [90, 180, 270]:
+            if parseBool(global_container_stack.getMetaDataEntry("repetier_webcamrot_%d%s" % (angle, suffix), False)):
+                rotation = angle
+        return {"mirror": mirror, "rotation": rotation}
+
     def _onUploadProgress(self, bytes_sent: int, bytes_total: int) -> None:
         if not self._progress_message:
             return
@@ -860,6 +989,73 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
         else:
             self._progress_message.setProgress(0)
 
+    ##  Store the elapsed time reported by Repetier and measure the rate at which it advances.
+    #   Between samples _interpolateProgress extrapolates from this snapshot.
+    def _updateProgressSample(self, elapsed: float) -> None:
+        now = time()
+        if self._progress_sample_time is not None and now > self._progress_sample_time and elapsed >= self._progress_sample_elapsed:
+            measured_rate = (elapsed - self._progress_sample_elapsed) / (now - self._progress_sample_time)
+            # Smooth the measured rate, and keep it within sane bounds in case of a hiccup in the updates
+            self._progress_rate = min(max(0.7 * self._progress_rate + 0.3 * measured_rate, 0.0), 2.0)
+        self._progress_sample_time = now
+        self._progress_sample_elapsed = elapsed
+        if not self._progress_timer.isActive():
+            self._progress_timer.start()
+
+    def _stopProgressInterpolation(self) -> None:
+        self._progress_timer.stop()
+        self._progress_sample_time = None
+        self._progress_rate = 1.0
+
+    def _interpolateProgress(self) -> None:
+        if self._progress_sample_time is None or not self._printers:
+            return
+        print_job = self._printers[0].activePrintJob
+        if not print_job or print_job.state != "printing":
+            self._stopProgressInterpolation()
+            return
+
+        since_sample = time() - self._progress_sample_time
+        if since_sample > 3 * self._update_timer.interval() / 1000:
+            # Don't keep extrapolating when status updates stop coming in
+            return
+
+        elapsed = self._progress_sample_elapsed + self._progress_rate * since_sample
+        if print_job.timeTotal > 0:
+            elapsed = min(elapsed, print_job.timeTotal)
+        print_job.updateTimeElapsed(int(elapsed))
+
+    ##  Record a timelapse of the camera while a job is printing, if the user enabled timelapses
+    def _updateTimelapse(self, print_job_state: str, job_name: str) -> None:
+        if print_job_state not in ["printing", "paused"]:
+            self._timelapse_recorder.stop()
+            return
+        if self._timelapse_recorder.isRecording() or not self._camera_url:
+            return
+
+        global_container_stack = CuraApplication.getInstance().getGlobalContainerStack()
+        if not global_container_stack or not parseBool(global_container_stack.getMetaDataEntry("repetier_timelapse", False)):
+            return
+        try:
+            capture_interval = max(float(global_container_stack.getMetaDataEntry("repetier_timelapse_interval", 10)), 0.1)
+        except ValueError:
+            capture_interval = 10.0
+
+        timelapse_path = os.path.join(Resources.getDataStoragePath(), "repetier_timelapses")
+        try:
+            os.makedirs(timelapse_path, exist_ok = True)
+        except EnvironmentError:
+            Logger.logException("w", "Could not create timelapse folder %s", timelapse_path)
+            return
+        file_name = "%s_%s.zip" % (
+            re.sub(r"[^\w\-]+", "_", job_name or "untitled_print"),
+            datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        )
+        self._timelapse_recorder.start(
+            os.path.join(timelapse_path, file_name), capture_interval,
+            QUrl(self._camera_url), QUrl(self._camera_snapshot_url)
+        )
+
     def _printerindex(self, jsonstr:str, repetier_id:str) -> int:
         count = 0
         rv=-1
@@ -967,30 +1163,7 @@ class RepetierOutputDevice(NetworkedPrinterOutputDevice):
         QDesktopServices.openUrl(QUrl(self._base_url))
 
     def _createEmptyRequest(self, target: str, content_type: Optional[str] = "application/json") -> QNetworkRequest:
-        if "upload" in target:
-             if self._forced_queue or not self._auto_print:
-                  request = QNetworkRequest(QUrl(self._save_url + "?a=" + target))
-             else:
-                  request = QNetworkRequest(QUrl(self._job_url + "?a=" + target))
-        else:	
-             request = QNetworkRequest(QUrl(self._api_url + "?a=" + target))
-        request.setAttribute(QNetworkRequest.FollowRedirectsAttribute, True)
-
-        request.setRawHeader(b"X-Api-Key", self._api_key)
-        request.setRawHeader(b"User-Agent", self._user_agent.encode())
-
-        if content_type is not None:
-            request.setHeader(QNetworkRequest.ContentTypeHeader, content_type)
-
-        # ignore SSL errors (eg for self-signed certificates)
-        ssl_configuration = QSslConfiguration.defaultConfiguration()
-        ssl_configuration.setPeerVerifyMode(QSslSocket.VerifyNone)
-        request.setSslConfiguration(ssl_configuration)
-
-        if self._basic_auth_data:
-            request.setRawHeader(b"Authorization", self._basic_auth_data)
-
-        return request
+        return self._request_factory.createRequest(target, content_type, save_upload = self._forced_queue or not self._auto_print)
 
     # This is a patched version from NetworkedPrinterOutputdevice, which adds "form_data" instead of "form-data"
     def _createFormPart(self, content_header: str, data: bytes, content_type: Optional[str] = None) -> QHttpPart:
@@ -5,12 +5,15 @@ from UM.OutputDevice.OutputDevicePlugin import OutputDevicePlugin
 from .RepetierOutputDevice import RepetierOutputDevice
 
 from .zeroconf import Zeroconf, ServiceBrowser, ServiceStateChange, ServiceInfo
+from .ZeroconfDriver import ZeroconfDriver
 from UM.Signal import Signal, signalemitter
 from UM.Application import Application
 from UM.Logger import Logger
 from UM.Util import parseBool
 
 from PyQt5.QtCore import QTimer
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
 import time
 import json
 import re
@@ -30,9 +33,16 @@ class RepetierOutputDevicePlugin(OutputDevicePlugin):
     def __init__(self) -> None:
         super().__init__()
         self._zero_conf = None
+        self._zeroconf_driver = None  # type: Optional[ZeroconfDriver]
         self._browser = None
         self._instances = {}
 
+        # Services that are not (fully) in the zeroconf cache are resolved on a pool of threads, so
+        # a service that does not respond does not hold up the discovery of other services
+        self._resolver_pool = None  # type: Optional[ThreadPoolExecutor]
+        self._resolving = {}  # type: Dict[str, Future]
+        self._resolving_lock = threading.Lock()
+
         # Because the model needs to be created in the same thread as the QMLEngine, we use a signal.
         self.addInstanceSignal.connect(self.addInstance)
         self.removeInstanceSignal.connect(self.removeInstance)
@@ -41,6 +51,13 @@ class RepetierOutputDevicePlugin(OutputDevicePlugin):
         # Load custom instances from preferences
         self._preferences = Application.getInstance().getPreferences()
         self._preferences.addPreference("Repetier/manual_instances", "{}")
+        self._preferences.addPreference("Repetier/gcode_batch_window", 50)
+        self._preferences.addPreference("Repetier/show_camera_metrics", False)
+        # Discovery of instances that announce themselves with zeroconf is opt-in. By default zeroconf
+        # runs on the Qt event loop; it can be run on its own threads instead
+        self._preferences.addPreference("Repetier/zeroconf_discovery", False)
+        self._preferences.addPreference("Repetier/zeroconf_service_type", "_repetier._tcp.local.")
+        self._preferences.addPreference("Repetier/zeroconf_threaded", False)
 
         try:
             self._manual_instances = json.loads(self._preferences.getValue("Repetier/manual_instances"))
@@ -65,14 +82,14 @@ class RepetierOutputDevicePlugin(OutputDevicePlugin):
         self.startDiscovery()
 
     def startDiscovery(self):
-        if self._browser:
-            self._browser.cancel()
-            self._browser = None
-            self._printers = {}
+        self._stopZeroconf()
         instance_keys = list(self._instances.keys())
         for key in instance_keys:
             self.removeInstance(key)
 
+        if parseBool(self._preferences.getValue("Repetier/zeroconf_discovery")):
+            self._startZeroconf()
+
         # Add manual instances from preference
         for name, properties in self._manual_instances.items():
             additional_properties = {
@@ -86,10 +103,50 @@ class RepetierOutputDevicePlugin(OutputDevicePlugin):
             self.addInstance(name, properties["address"], properties["port"], additional_properties)
 
         self.instanceListChanged.emit()
+
+    def _startZeroconf(self) -> None:
+        service_type = self._preferences.getValue("Repetier/zeroconf_service_type")
+        try:
+            if parseBool(self._preferences.getValue("Repetier/zeroconf_threaded")):
+                self._zero_conf = Zeroconf()
+                self._browser = ServiceBrowser(self._zero_conf, service_type, [self._onServiceChanged])
+                self._keep_alive_timer.start()
+            else:
+                # Packets are handled and handlers are called on the main thread
+                self._zeroconf_driver = ZeroconfDriver()
+                self._zero_conf = self._zeroconf_driver.getZeroconf()
+                self._browser = self._zeroconf_driver.addServiceBrowser(service_type, [self._onServiceChanged])
+        except Exception:
+            Logger.logException("e", "Could not start zeroconf discovery of %s", service_type)
+            self._stopZeroconf()
+            return
+        Logger.log("d", "Started zeroconf discovery of %s", service_type)
+
+    def _stopZeroconf(self) -> None:
+        self._keep_alive_timer.stop()
+        if self._zeroconf_driver:
+            # Closing the driver cancels its browsers and closes its zeroconf instance
+            self._zeroconf_driver.close()
+            self._zeroconf_driver = None
+        else:
+            if self._browser:
+                self._browser.cancel()
+            if self._zero_conf:
+                self._zero_conf.close()
+        self._browser = None # type: Optional[ServiceBrowser]
+        self._zero_conf = None
+        # Services that were being resolved are looked up again when discovery restarts
+        with self._resolving_lock:
+            for future in self._resolving.values():
+                future.cancel()
+            self._resolving = {}
+
     def _keepDiscoveryAlive(self) -> None:
         if not self._browser or not self._browser.is_alive():
             Logger.log("w", "Zeroconf discovery has died, restarting discovery of Repetier instances.")
             self.startDiscovery()
+        else:
+            self._keep_alive_timer.start()
 
     def addManualInstance(self, name: str, address: str, port: int, path: str, useHttps: bool = False, userName: str = "", password: str = "", repetierid: str = "")-> None:
         self._manual_instances[name] = {"address": address, "port": port, "path": path, "useHttps": useHttps, "userName": userName, "password": password, "repetier_id":repetierid}
@@ -114,12 +171,10 @@ class RepetierOutputDevicePlugin(OutputDevicePlugin):
 
     ##  Stop looking for devices on network.
     def stop(self) -> None:
-        self._keep_alive_timer.stop()
-        if self._browser:
-            self._browser.cancel()
-        self._browser = None # type: Optional[ServiceBrowser]
-        if self._zero_conf:
-            self._zero_conf.close()
+        self._stopZeroconf()
+        if self._resolver_pool:
+            self._resolver_pool.shutdown(wait = False)
+            self._resolver_pool = None
 
     def getInstances(self) -> Dict[str, Any]:
         return self._instances
@@ -197,32 +252,73 @@ class RepetierOutputDevicePlugin(OutputDevicePlugin):
             address = ""
             for record in zeroconf.cache.entries_with_name(info.server):
                 info.update_record(zeroconf, time.time(), record)
-                try:
-                    ip = ipaddress.IPv4Address(record.address) # IPv4
-                except ipaddress.AddressValueError:
-                    ip = ipaddress.IPv6Address(record.address) # IPv6
-                except:
-                    continue
-
-                if not ip.is_link_local: # don't accept 169.254.x.x address
-                    address = str(ip) if ip.version == 4 else "[%s]" % str(ip)
+                address = self._getServiceAddress(getattr(record, "address", None))
+                if address:
                     break
 
-            # Request more data if info is not complete
-            if not address or not info.port:
-                Logger.log("d", "Trying to get address of %s", name)
-                requested_info = zeroconf.get_service_info(service_type, key)
-
-                if not requested_info:
-                    Logger.log("w", "Could not get information about %s" % name)
-                    return
-
-                info = requested_info
-
             if address and info.port:
                 self.addInstanceSignal.emit(name, address, info.port, info.properties)
-            else:
-                Logger.log("d", "Discovered instance named %s but received no address", name)
+                return
+
+            # Request more data if info is not complete
+            self._resolveService(zeroconf, service_type, key, name)
 
         elif state_change == ServiceStateChange.Removed:
+            with self._resolving_lock:
+                future = self._resolving.pop(name, None)
+            if future:
+                future.cancel()
             self.removeInstanceSignal.emit(str(name))
+
+    ##  Request the information about a service that is not in the zeroconf cache on the resolver pool.
+    #   The instance is added as soon as the request finishes.
+    def _resolveService(self, zeroconf: Zeroconf, service_type: str, key: str, name: str) -> None:
+        with self._resolving_lock:
+            if key in self._resolving:
+                return
+            if self._resolver_pool is None:
+                self._resolver_pool = ThreadPoolExecutor(max_workers = 8)
+            Logger.log("d", "Trying to get address of %s", name)
+            future = self._resolver_pool.submit(zeroconf.get_service_info, service_type, key)
+            self._resolving[key] = future
+        future.add_done_callback(lambda future: self._onServiceResolved(future, key, name))
+
+    def _onServiceResolved(self, future: Future, key: str, name: str) -> None:
+        with self._resolving_lock:
+            if self._resolving.get(key) is not future:
+                return  # The service was removed, or discovery was stopped in the meantime
+            del self._resolving[key]
+
+        try:
+            info = future.result()
+        except Exception:
+            Logger.logException("w", "Could not get information about %s", name)
+            return
+        if not info:
+            Logger.log("w", "Could not get information about %s" % name)
+            return
+
+        address = self._getServiceAddress(info.address)
+        if address and info.port:
+            # The signal is handled on the main thread
+            self.addInstanceSignal.emit(name, address, info.port, info.properties)
+        else:
+            Logger.log("d", "Discovered instance named %s but received no address", name)
+
+    ##  Get the address of a service as a string that can be used in an url, or an empty string if
+    #   the address can not be used
+    @staticmethod
+    def _getServiceAddress(address: Optional[bytes]) -> str:
+        try:
+            ip = ipaddress.IPv4Address(address) # IPv4
+        except ipaddress.AddressValueError:
+            try:
+                ip = ipaddress.IPv6Address(address) # IPv6
+            except ValueError:
+                return ""
+        except ValueError:
+            return ""
+
+        if ip.is_link_local: # don't accept 169.254.x.x address
+            return ""
+        return str(ip) if ip.version == 4 else "[%s]" % str(ip)
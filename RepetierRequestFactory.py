@@ -0,0 +1,74 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# RepetierRequestFactory is released under the terms of the LGPLv3 or higher.
+
+from PyQt5.QtCore import QUrl
+from PyQt5.QtNetwork import QNetworkRequest, QSslConfiguration, QSslSocket
+
+from typing import Dict, Optional
+
+#
+# Creates the requests to a Repetier instance. The headers, auth data and ssl configuration are set
+# once on a template request, which every request is copied from; copying a request is cheap because
+# its data is implicitly shared. The urls of the api end points are cached as well. Upload urls are
+# not cached, because they contain the name of the file.
+#
+class RepetierRequestFactory:
+    def __init__(self, api_url: str, job_url: str, save_url: str, user_agent: str, basic_auth_data: Optional[bytes] = None) -> None:
+        self._api_url = api_url
+        self._job_url = job_url  # uploads that are printed right away
+        self._save_url = save_url  # uploads that are stored or queued
+        self._user_agent = user_agent.encode()
+        self._basic_auth_data = basic_auth_data
+        self._api_key = b""
+
+        self._template = None  # type: Optional[QNetworkRequest]
+        self._urls = {}  # type: Dict[str, QUrl]
+
+    ##  Set the API key of the instance. The template and the cached urls are created anew after this.
+    def setApiKey(self, api_key: str) -> None:
+        self._api_key = api_key.encode()
+        self._template = None
+        self._urls = {}
+
+    ##  Create a request for an api target (eg "stateList" or "upload&name=..."); uploads are sent to
+    #   the job end point, or to the model end point if they are saved to be printed later.
+    def createRequest(self, target: str, content_type: Optional[str] = "application/json", save_upload: bool = False) -> QNetworkRequest:
+        if "upload" in target:
+            url = QUrl((self._save_url if save_upload else self._job_url) + "?a=" + target)
+        else:
+            url = self._urls.get(target)
+            if url is None:
+                url = QUrl(self._api_url + "?a=" + target)
+                self._urls[target] = url
+
+        request = QNetworkRequest(self.getTemplate())
+        request.setUrl(url)
+
+        if "upload" in target:
+            # Let polls and commands on the same connection go ahead of bulk transfers
+            request.setPriority(QNetworkRequest.LowPriority)
+
+        if content_type is not None:
+            request.setHeader(QNetworkRequest.ContentTypeHeader, content_type)
+
+        return request
+
+    ##  Get the request that all requests to the instance are copied from, creating it if needed.
+    def getTemplate(self) -> QNetworkRequest:
+        if self._template is None:
+            request = QNetworkRequest()
+            request.setAttribute(QNetworkRequest.FollowRedirectsAttribute, True)
+
+            request.setRawHeader(b"X-Api-Key", self._api_key)
+            request.setRawHeader(b"User-Agent", self._user_agent)
+
+            # ignore SSL errors (eg for self-signed certificates)
+            ssl_configuration = QSslConfiguration.defaultConfiguration()
+            ssl_configuration.setPeerVerifyMode(QSslSocket.VerifyNone)
+            request.setSslConfiguration(ssl_configuration)
+
+            if self._basic_auth_data:
+                request.setRawHeader(b"Authorization", self._basic_auth_data)
+
+            self._template = request
+        return self._template
@@ -0,0 +1,113 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# TimelapseRecorder is released under the terms of the AGPLv3 or higher.
+
+from PyQt5.QtCore import QObject, QUrl
+
+from UM.Application import Application
+from UM.Logger import Logger
+
+from .MJPEGStream import MJPEGStream
+
+import json
+import queue
+import threading
+import zipfile
+from time import time
+
+from typing import List, Optional, Tuple
+
+#
+# Records a timelapse of a camera stream by storing the raw jpeg frames, as split from the stream,
+# in a zip file along with an index of the frames. Frames are not decoded or re-encoded. The camera
+# is only polled for snapshots at the capture interval, and the zip file is written on a background
+# thread that finishes the file by itself when recording stops. Only when Cura quits is the thread
+# waited for, so the zip file is complete.
+#
+class TimelapseRecorder(QObject):
+    # Maximum time to wait for the zip files to be finished when Cura quits, in seconds
+    _shutdown_timeout = 10.0
+
+    def __init__(self, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+
+        self._stream = None  # type: Optional[MJPEGStream]
+
+        self._file_path = ""
+        self._frame_queue = None  # type: Optional[queue.Queue]
+        self._writer_threads = []  # type: List[threading.Thread]  # Threads that have not finished their file yet
+
+        Application.getInstance().applicationShuttingDown.connect(self._onApplicationShuttingDown)
+
+    def isRecording(self) -> bool:
+        return self._stream is not None
+
+    ##  Start recording a camera to a zip file.
+    #   \param capture_interval The time between captured frames, in seconds.
+    def start(self, file_path: str, capture_interval: float, source_url: QUrl, snapshot_url: QUrl = QUrl()) -> None:
+        self.stop()
+
+        self._file_path = file_path
+
+        self._frame_queue = queue.Queue()
+        writer_thread = threading.Thread(target = self._writeFrames, args = (file_path, self._frame_queue), name = "TimelapseWriter " + file_path, daemon = True)
+        writer_thread.start()
+        self._writer_threads = [thread for thread in self._writer_threads if thread.is_alive()] + [writer_thread]
+
+        # Only a frame per capture interval is needed, so the camera is polled for snapshots instead
+        # of receiving its full stream. Without a snapshot url the snapshots are taken from the stream.
+        self._stream = MJPEGStream.getStream(source_url, snapshot_url, max(int(capture_interval * 1000), 1))
+        self._stream.frameReceived.connect(self._onFrameReceived)
+        self._stream.subscribe(self, raw_frames_only = True)
+        Logger.log("i", "Recording timelapse to %s", file_path)
+
+    def stop(self) -> None:
+        if self._stream is None:
+            return
+
+        self._stream.frameReceived.disconnect(self._onFrameReceived)
+        self._stream.unsubscribe(self)
+        self._stream = None
+
+        # The writer thread finishes the file once it gets to the end of the queue
+        self._frame_queue.put(None)
+        self._frame_queue = None
+        Logger.log("i", "Stopped recording timelapse to %s", self._file_path)
+
+    def _onApplicationShuttingDown(self) -> None:
+        self.stop()
+
+        # The writer threads would be killed when Cura exits, leaving incomplete zip files
+        deadline = time() + self._shutdown_timeout
+        for thread in self._writer_threads:
+            thread.join(max(deadline - time(), 0))
+            if thread.is_alive():
+                Logger.log("w", "Timed out finishing timelapse in %s", thread.name)
+        self._writer_threads = []
+
+    def _onFrameReceived(self, data: bytes) -> None:
+        # The stream only delivers a snapshot per capture interval, so every frame is kept
+        if self._frame_queue is None:
+            return
+        self._frame_queue.put((time(), data))
+
+    @staticmethod
+    def _writeFrames(file_path: str, frame_queue: queue.Queue) -> None:
+        index = []  # type: List[Tuple[str, float]]
+        try:
+            # Jpeg frames do not compress, so they are stored as they are
+            with zipfile.ZipFile(file_path, "w", zipfile.ZIP_STORED) as timelapse_file:
+                while True:
+                    frame = frame_queue.get()
+                    if frame is None:
+                        break
+                    capture_time, data = frame
+                    name = "frame_%06d.jpg" % len(index)
+                    timelapse_file.writestr(name, data)
+                    index.append((name, capture_time))
+
+                timelapse_file.writestr("index.json", json.dumps([
+                    {"file": name, "time": capture_time} for name, capture_time in index
+                ]))
+            Logger.log("i", "Finished timelapse %s with %d frames", file_path, len(index))
+        except EnvironmentError:
+            Logger.logException("e", "Could not write timelapse to %s", file_path)
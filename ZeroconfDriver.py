@@ -0,0 +1,77 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# ZeroconfDriver is released under the terms of the LGPLv3 or higher.
+
+from PyQt5.QtCore import QObject, QTimer, QSocketNotifier
+
+from .zeroconf import Zeroconf, ServiceBrowser, InterfaceChoice, current_time_millis
+
+from typing import Any, Callable, List, Optional
+
+#
+# Drives a zeroconf instance from the Qt event loop instead of from its own threads. The multicast
+# socket is read when a socket notifier signals it has data, and a single timer fires when a
+# service browser needs to send its next query or when entries in the cache expire. All packets
+# are handled and all service browser handlers are called on the thread the driver lives in.
+#
+class ZeroconfDriver(QObject):
+    # Maximum time between polls, in case an expiration time changes without a packet coming in
+    _max_poll_interval = 10 * 1000
+
+    def __init__(self, interfaces: Any = InterfaceChoice.All, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+
+        self._zeroconf = Zeroconf(interfaces, threaded = False)
+        self._browsers = []  # type: List[ServiceBrowser]
+
+        self._socket_notifier = QSocketNotifier(self._zeroconf.listen_socket.fileno(), QSocketNotifier.Read)
+        self._socket_notifier.activated.connect(self._onSocketActivated)
+
+        self._poll_timer = QTimer()
+        self._poll_timer.setSingleShot(True)
+        self._poll_timer.timeout.connect(self._poll)
+        self._poll()
+
+    def getZeroconf(self) -> Zeroconf:
+        return self._zeroconf
+
+    ##  Start browsing for a service type. The handlers are called on the thread the driver lives in.
+    def addServiceBrowser(self, service_type: str, handlers: List[Callable[..., None]]) -> ServiceBrowser:
+        browser = ServiceBrowser(self._zeroconf, service_type, handlers)
+        self._browsers.append(browser)
+        self._poll()
+        return browser
+
+    def removeServiceBrowser(self, browser: ServiceBrowser) -> None:
+        if browser in self._browsers:
+            self._browsers.remove(browser)
+        browser.cancel()
+
+    def close(self) -> None:
+        self._socket_notifier.setEnabled(False)
+        self._poll_timer.stop()
+        for browser in self._browsers:
+            browser.cancel()
+        self._browsers = []
+        self._zeroconf.close()
+
+    def _onSocketActivated(self, socket: int) -> None:
+        if self._zeroconf.done:
+            return
+        self._zeroconf.listener.handle_read(self._zeroconf.listen_socket)
+        # The packet may have brought changes for the browsers to hand to their handlers
+        self._poll()
+
+    def _poll(self) -> None:
+        if self._zeroconf.done:
+            return
+        now = current_time_millis()
+        self._zeroconf.reap(now)
+
+        next_time = now + self._max_poll_interval
+        for browser in self._browsers:
+            next_time = min(next_time, browser.poll(now))
+        expiration_time = self._zeroconf.cache.next_expiration_time()
+        if expiration_time is not None:
+            next_time = min(next_time, expiration_time)
+
+        self._poll_timer.start(max(int(next_time - current_time_millis()), 0))
@@ -0,0 +1,105 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+# Reports how many mDNS packets per second DNSIncoming parses: responses that announce a few services
+# (PTR, SRV, TXT and A records with compressed names each) and browse queries with known answers.
+# For comparison, the same packets are parsed with the decoder that was used before the structs were
+# precompiled and the decoded names were kept, and both must give the same records.
+# Run with: python tests/bench_dns_incoming.py [--packets N] [--services-per-packet N]
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from six import indexbytes
+
+from zeroconf import DNSIncoming, IncomingDecodeError
+
+from dns_packets import queryPacket, responsePacket
+
+
+# The decoder before the structs were precompiled and the decoded names were kept
+class PreviousDNSIncoming(DNSIncoming):
+    def unpack_struct(self, struct_):
+        length = struct.calcsize(struct_.format)
+        info = struct.unpack(struct_.format, self.data[self.offset:self.offset + length])
+        self.offset += length
+        return info
+
+    def read_name(self):
+        result = ""
+        off = self.offset
+        next_ = -1
+        first = off
+
+        while True:
+            length = indexbytes(self.data, off)
+            off += 1
+            if length == 0:
+                break
+            t = length & 0xC0
+            if t == 0x00:
+                result = "".join((result, self.read_utf(off, length) + "."))
+                off += length
+            elif t == 0xC0:
+                if next_ < 0:
+                    next_ = off + 1
+                off = ((length & 0x3F) << 8) | indexbytes(self.data, off)
+                if off >= first:
+                    raise IncomingDecodeError("Bad domain name (circular) at %s" % (off,))
+                first = off
+            else:
+                raise IncomingDecodeError("Bad domain name at %s" % (off,))
+
+        if next_ >= 0:
+            self.offset = next_
+        else:
+            self.offset = off
+        return result
+
+
+def parsedRecords(msg):
+    return [msg.valid] + [(question.name, question.type, question.class_) for question in msg.questions] + \
+        [(record.name, record.type, record.class_, record.unique, record.ttl, record) for record in msg.answers]
+
+
+def bench(label: str, decoder, packets, rounds: int):
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        for packet in packets:
+            decoder(packet)
+    elapsed = time.perf_counter() - start_time
+
+    print("%-10s %6d packets %8.1f kB %10.0f packets/s" % (
+        label, len(packets), sum(len(packet) for packet in packets) / 1e3, len(packets) * rounds / elapsed))
+    return [parsedRecords(decoder(packet)) for packet in packets]
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description = "Benchmark the zeroconf packet decoder")
+    arguments.add_argument("--packets", type = int, default = 1000)
+    arguments.add_argument("--services-per-packet", type = int, default = 3)
+    arguments.add_argument("--rounds", type = int, default = 5)
+    options = arguments.parse_args()
+
+    packets = []
+    for index in range(options.packets):
+        if index % 4 == 3:
+            packets.append(queryPacket(list(range(index % 8))))
+        else:
+            packets.append(responsePacket(list(range(index, index + options.services_per_packet))))
+
+    results = bench("current", DNSIncoming, packets, options.rounds)
+    previous_results = bench("previous", PreviousDNSIncoming, packets, options.rounds)
+
+    correct = results == previous_results and all(result[0] for result in results)
+    print("records %s" % ("identical" if correct else "MISMATCH"))
+    return 0 if correct else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
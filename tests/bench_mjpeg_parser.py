@@ -0,0 +1,63 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+# Reports the throughput of the mjpeg stream parser on synthetic streams, and checks that every
+# frame was extracted. Run with: python tests/bench_mjpeg_parser.py [--frames N] [--chunk-size N]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MJPEGStreamParser import MJPEGStreamParser
+
+from mjpeg_streams import BOUNDARY, generateStream
+
+
+def fixedChunks(stream: bytes, chunk_size: int):
+    for index in range(0, len(stream), chunk_size):
+        yield stream[index:index + chunk_size]
+
+
+def bench(mode: str, frame_count: int, chunk_size: int, thumbnails: float, garbage_size: int) -> bool:
+    rng = random.Random(0)
+    frames, stream = generateStream(rng, frame_count, mode, min_size = 20000, max_size = 120000, thumbnails = thumbnails, garbage_size = garbage_size)
+    chunks = list(fixedChunks(stream, chunk_size))
+
+    parser = MJPEGStreamParser()
+    if mode != "markers":
+        parser.setBoundary(BOUNDARY)
+    found = []
+    start_time = time.perf_counter()
+    for chunk in chunks:
+        found += parser.feed(chunk)
+    elapsed = time.perf_counter() - start_time
+
+    correct = found == frames
+    print("%-20s %6d frames %8.1f MB %10.0f frames/s %8.1f MB/s  %s" % (
+        mode + (" +garbage" if garbage_size else ""), len(found), len(stream) / 1e6,
+        len(found) / elapsed, len(stream) / 1e6 / elapsed, "ok" if correct else "MISMATCH"))
+    return correct
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description = "Benchmark the mjpeg stream parser")
+    arguments.add_argument("--frames", type = int, default = 300)
+    arguments.add_argument("--chunk-size", type = int, default = 16384)
+    options = arguments.parse_args()
+
+    results = [
+        bench("markers", options.frames, options.chunk_size, 0.0, 0),
+        bench("markers", options.frames, options.chunk_size, 1.0, 0),
+        bench("markers", options.frames, options.chunk_size, 0.3, 1000),
+        bench("multipart", options.frames, options.chunk_size, 0.3, 0),
+        bench("multipart-nolength", options.frames, options.chunk_size, 0.3, 0),
+    ]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+# Reports how long it takes to create the request for a status poll, by copying the template of the
+# request factory, and by building the request from scratch as it was done before: formatting the
+# url, setting every header and getting the default ssl configuration for each request.
+# Run with: python tests/bench_request_factory.py [--requests N]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QUrl
+from PyQt5.QtNetwork import QNetworkRequest, QSslConfiguration, QSslSocket
+
+from RepetierRequestFactory import RepetierRequestFactory
+
+API_URL = "http://printer.local:3344/printer/api/vmaxx"
+USER_AGENT = "Cura/4.8 RepetierIntegration/1.0"
+BASIC_AUTH_DATA = b"basic dXNlcjpwYXNz"
+TARGETS = ["stateList", "listPrinter", "getPrinterConfig", "listModels"]
+
+
+def requestFromScratch(target: str) -> QNetworkRequest:
+    request = QNetworkRequest(QUrl(API_URL + "?a=" + target))
+    request.setAttribute(QNetworkRequest.FollowRedirectsAttribute, True)
+    request.setRawHeader("User-Agent".encode(), USER_AGENT.encode())
+    request.setRawHeader("x-api-key".encode(), "secret".encode())
+    request.setRawHeader("Authorization".encode(), BASIC_AUTH_DATA)
+    ssl_configuration = QSslConfiguration.defaultConfiguration()
+    ssl_configuration.setPeerVerifyMode(QSslSocket.VerifyNone)
+    request.setSslConfiguration(ssl_configuration)
+    request.setHeader(QNetworkRequest.ContentTypeHeader, "application/json")
+    return request
+
+
+def headers(request: QNetworkRequest):
+    return {bytes(name).lower(): bytes(request.rawHeader(name)) for name in request.rawHeaderList()}
+
+
+def bench(label: str, create_request, request_count: int) -> None:
+    start_time = time.perf_counter()
+    for index in range(request_count):
+        create_request(TARGETS[index % len(TARGETS)])
+    elapsed = time.perf_counter() - start_time
+    print("%-10s %8d requests %8.2f us/request" % (label, request_count, elapsed / request_count * 1e6))
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description = "Benchmark creating requests to a Repetier instance")
+    arguments.add_argument("--requests", type = int, default = 100000)
+    options = arguments.parse_args()
+
+    factory = RepetierRequestFactory(API_URL, "", "", USER_AGENT, BASIC_AUTH_DATA)
+    factory.setApiKey("secret")
+
+    bench("template", factory.createRequest, options.requests)
+    bench("scratch", requestFromScratch, options.requests)
+
+    # Both must give the same request
+    for target in TARGETS:
+        request = factory.createRequest(target)
+        expected = requestFromScratch(target)
+        if request.url() != expected.url() or headers(request) != headers(expected):
+            print("MISMATCH for %s" % target)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+# Replays the responses of a network of services (4 records each: PTR, SRV, TXT and A) into the
+# DNS cache of a zeroconf instance, first into an empty cache and then again to refresh it, and
+# reports how many packets per second Zeroconf.handle_response gets through. For comparison, the
+# same packets are replayed with the lookup that was used before the cache was indexed, which
+# concatenated all cached entries into one list for every record.
+# Run with: python tests/bench_zeroconf_cache.py [--services N] [--rounds N]
+
+import argparse
+import os
+import sys
+import time
+from functools import reduce
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zeroconf import DNSIncoming, Zeroconf, current_time_millis
+
+from dns_packets import responsePacket
+
+
+# The lookup of handle_response before the cache was indexed, on a cache of lists per name
+class EntryScanCache:
+    def __init__(self):
+        self.lists = {}
+
+    def handleResponse(self, msg):
+        now = current_time_millis()
+        for record in msg.answers:
+            expired = record.is_expired(now)
+            values = list(self.lists.values())
+            if record in (reduce(lambda a, b: a + b, values) if values else []):
+                if expired:
+                    self.lists[record.key].remove(record)
+                else:
+                    for entry in self.lists[record.key]:
+                        if entry == record:
+                            entry.reset_ttl(record)
+                            break
+            else:
+                self.lists.setdefault(record.key, []).append(record)
+
+    def size(self):
+        return sum(len(entries) for entries in self.lists.values())
+
+
+def replay(handle_response, messages, rounds: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        for msg in messages:
+            handle_response(msg)
+    return time.perf_counter() - start_time
+
+
+def bench(label: str, handle_response, cache_size, packets, rounds: int) -> int:
+    # Parse first, so only the handling of the records is measured
+    first_messages = [DNSIncoming(packet) for packet in packets]
+    elapsed_add = replay(handle_response, first_messages, 1)
+    refresh_messages = [DNSIncoming(packet) for packet in packets]
+    elapsed_refresh = replay(handle_response, refresh_messages, rounds)
+
+    print("%-12s %6d records %12.0f packets/s (empty cache) %12.0f packets/s (refresh)" % (
+        label, cache_size(), len(packets) / elapsed_add, len(packets) * rounds / elapsed_refresh))
+    return cache_size()
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description = "Benchmark the zeroconf DNS cache")
+    arguments.add_argument("--services", type = int, default = 250)
+    arguments.add_argument("--rounds", type = int, default = 5)
+    options = arguments.parse_args()
+
+    packets = [responsePacket([index]) for index in range(options.services)]
+
+    zeroconf = Zeroconf(["127.0.0.1"], threaded = False)
+    try:
+        indexed_size = bench("indexed", zeroconf.handle_response, lambda: len(zeroconf.cache.entries()), packets, options.rounds)
+    finally:
+        zeroconf.close()
+
+    entry_scan_cache = EntryScanCache()
+    scan_size = bench("entry scan", entry_scan_cache.handleResponse, entry_scan_cache.size, packets, 1)
+
+    return 0 if indexed_size == scan_size == options.services * 4 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import os
+import sys
+
+# The plugin is a package that needs Cura to be imported as a whole, but the modules that do not
+# depend on Cura or Qt can be imported on their own
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
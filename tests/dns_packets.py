@@ -0,0 +1,46 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import socket
+
+from typing import List, Optional
+
+from zeroconf import (DNSAddress, DNSOutgoing, DNSPointer, DNSQuestion, DNSRecord, DNSService, DNSText,
+                      _CLASS_IN, _CLASS_UNIQUE, _FLAGS_AA, _FLAGS_QR_QUERY, _FLAGS_QR_RESPONSE, _TYPE_A, _TYPE_PTR,
+                      _TYPE_SRV, _TYPE_TXT)
+
+#
+# Builds mDNS packets like the ones Repetier-Server instances and the zeroconf browser send: responses
+# with a PTR, SRV, TXT and A record for each service, and browse queries. The names in the packets are
+# compressed the way DNSOutgoing compresses them.
+#
+
+SERVICE_TYPE = "_repetier._tcp.local."
+
+
+def serviceRecords(index: int) -> List[DNSRecord]:
+    name = "Printer %d.%s" % (index, SERVICE_TYPE)
+    server = "printer-%d.local." % index
+    address = socket.inet_aton("10.%d.%d.%d" % (index >> 16 & 0xFF, index >> 8 & 0xFF, index & 0xFF))
+    return [
+        DNSPointer(SERVICE_TYPE, _TYPE_PTR, _CLASS_IN, 4500, name),
+        DNSService(name, _TYPE_SRV, _CLASS_IN | _CLASS_UNIQUE, 120, 0, 0, 3344, server),
+        DNSText(name, _TYPE_TXT, _CLASS_IN | _CLASS_UNIQUE, 4500, b"\x09txtvers=1\x0bslug=printer\x0dmodel=VMaxx 3D"),
+        DNSAddress(server, _TYPE_A, _CLASS_IN | _CLASS_UNIQUE, 120, address),
+    ]
+
+
+def responsePacket(indices: List[int]) -> bytes:
+    out = DNSOutgoing(_FLAGS_QR_RESPONSE | _FLAGS_AA)
+    for index in indices:
+        for record in serviceRecords(index):
+            out.add_answer_at_time(record, 0)
+    return out.packet()
+
+
+def queryPacket(known_indices: Optional[List[int]] = None) -> bytes:
+    out = DNSOutgoing(_FLAGS_QR_QUERY)
+    out.add_question(DNSQuestion(SERVICE_TYPE, _TYPE_PTR, _CLASS_IN))
+    for index in known_indices or []:
+        out.add_answer_at_time(serviceRecords(index)[0], 0)
+    return out.packet()
@@ -0,0 +1,100 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import random
+
+from typing import Iterator, List, Optional, Tuple
+
+#
+# Generates synthetic mjpeg streams for the parser tests and benchmark. The frames are not
+# decodable images, but have the marker structure of real jpeg files: header segments, optionally
+# an exif segment with an embedded thumbnail, and entropy coded data with escaped 0xFF bytes and
+# restart markers.
+#
+
+BOUNDARY = b"frameboundary"
+
+
+def segment(marker: int, payload: bytes) -> bytes:
+    return bytes([0xFF, marker]) + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+def entropyData(size: int, rng: random.Random) -> bytes:
+    data = bytearray(rng.getrandbits(8) for _ in range(size))
+    result = bytearray()
+    for byte in data:
+        result.append(byte)
+        if byte == 0xFF:
+            # Escaped 0xFF, or now and then a restart marker
+            result.append(0xD0 + rng.randrange(8) if rng.random() < 0.1 else 0x00)
+    return bytes(result)
+
+
+def jpegFrame(size: int, rng: random.Random, thumbnail: bool = False) -> bytes:
+    frame = b"\xff\xd8" + segment(0xE0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+    if thumbnail:
+        embedded = b"\xff\xd8" + segment(0xDB, bytes(65)) + segment(0xDA, bytes(10)) + entropyData(rng.randrange(50, 2000), rng) + b"\xff\xd9"
+        frame += segment(0xE1, b"Exif\x00\x00" + bytes(20) + embedded + bytes(8))
+    frame += segment(0xDB, bytes(65)) + segment(0xC0, bytes(15)) + segment(0xC4, bytes(30)) + segment(0xDA, bytes(10))
+    return frame + entropyData(size, rng) + b"\xff\xd9"
+
+
+def garbage(size: int, rng: random.Random) -> bytes:
+    # Random bytes that don't contain a complete end marker, which would end a frame early
+    return bytes(rng.getrandbits(8) for _ in range(size)).replace(b"\xff\xd9", b"\xff\x00")
+
+
+##  Generate frames of varied sizes, and the stream that holds them.
+#   \param mode "markers" for a bare stream of jpeg frames, "multipart" for a multipart stream with
+#   Content-Length headers, or "multipart-nolength" for one without.
+def generateStream(rng: random.Random, frame_count: int, mode: str = "markers", min_size: int = 100, max_size: int = 50000,
+                   thumbnails: float = 0.3, garbage_size: int = 0) -> Tuple[List[bytes], bytes]:
+    frames = [jpegFrame(rng.randrange(min_size, max_size), rng, thumbnail = rng.random() < thumbnails) for _ in range(frame_count)]
+
+    stream = bytearray()
+    for frame in frames:
+        if mode == "markers":
+            if garbage_size:
+                stream += garbage(rng.randrange(garbage_size), rng)
+            stream += frame
+        else:
+            stream += b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n"
+            if mode == "multipart":
+                stream += b"Content-Length: %d\r\n" % len(frame)
+            stream += b"\r\n" + frame + b"\r\n"
+    if mode != "markers":
+        # Without a Content-Length a part only ends at the next delimiter
+        stream += b"--" + BOUNDARY + b"\r\n"
+    return frames, bytes(stream)
+
+
+##  Split a stream into chunks of random sizes, including chunks of a single byte so the start and
+#   end markers are split between chunks.
+def chunkStream(stream: bytes, rng: random.Random, max_chunk_size: int = 8192) -> Iterator[bytes]:
+    index = 0
+    while index < len(stream):
+        size = rng.choice([1, 2, 3, rng.randrange(1, max_chunk_size)])
+        yield stream[index:index + size]
+        index += size
+
+
+##  Split a stream into chunks so every chunk ends in the middle of a start or end marker
+def chunkStreamAtMarkers(stream: bytes) -> Iterator[bytes]:
+    index = 0
+    while True:
+        marker_indices = [found for found in (stream.find(b"\xff\xd8", index), stream.find(b"\xff\xd9", index)) if found != -1]
+        if not marker_indices:
+            break
+        split_index = min(marker_indices) + 1
+        yield stream[index:split_index]
+        index = split_index
+    yield stream[index:]
+
+
+def parse(parser, chunks: Iterator[bytes], boundary: Optional[bytes] = None) -> List[bytes]:
+    if boundary:
+        parser.setBoundary(boundary)
+    frames = []  # type: List[bytes]
+    for chunk in chunks:
+        frames += parser.feed(chunk)
+    return frames
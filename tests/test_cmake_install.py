@@ -0,0 +1,18 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import os
+import re
+
+plugin_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# The plugin fails to load if any of its modules is not installed along with it
+def test_allPluginFilesAreInstalled():
+    with open(os.path.join(plugin_path, "CMakeLists.txt")) as f:
+        match = re.search(r"install\(FILES(.*?)DESTINATION", f.read(), re.DOTALL)
+    assert match
+    installed_files = set(match.group(1).split())
+
+    plugin_files = {file_name for file_name in os.listdir(plugin_path) if os.path.splitext(file_name)[1] in (".py", ".qml", ".json")}
+    assert plugin_files - installed_files == set()
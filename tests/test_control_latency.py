@@ -0,0 +1,120 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("PyQt5.QtNetwork")
+
+from PyQt5.QtCore import QByteArray, QCoreApplication, QEventLoop, QUrl
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest
+
+from ControlNetworkManager import ControlNetworkManager
+
+UPLOAD_SIZE = 20 * 1000 * 1000
+UPLOAD_READ_RATE = 5 * 1000 * 1000  # bytes per second the server reads uploads at
+
+
+class _RepetierHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if self.path.startswith("/upload"):
+            # Read the upload slowly, so it saturates the connection for a while
+            remaining = length
+            while remaining > 0:
+                data = self.rfile.read(min(remaining, 50000))
+                if not data:
+                    break
+                remaining -= len(data)
+                time.sleep(50000 / UPLOAD_READ_RATE)
+        else:
+            self.rfile.read(length)
+            self.server.command_times.append(time.monotonic())
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _RepetierServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RepetierHandler)
+        self.command_times = []
+        self.connection_count = 0
+
+    def verify_request(self, request, client_address):
+        self.connection_count += 1
+        return True
+
+
+@pytest.fixture
+def server():
+    server = _RepetierServer()
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def application():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def _waitFor(application, condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        application.processEvents(QEventLoop.AllEvents, 10)
+    return condition()
+
+
+def _url(server, path):
+    return QUrl("http://127.0.0.1:%d%s" % (server.server_address[1], path))
+
+
+def test_connectionIsOpenedBeforeFirstCommand(application, server):
+    control_manager = ControlNetworkManager("127.0.0.1", server.server_address[1])
+    assert _waitFor(application, lambda: server.connection_count > 0, 5)
+    # The server may accept the connection before Qt has seen that it is connected
+    _waitFor(application, lambda: False, 0.2)
+
+    # Warming up an open connection does not open another one
+    control_manager.warmUp()
+    _waitFor(application, lambda: False, 0.2)
+    assert server.connection_count == 1
+
+
+def test_cancelLatencyDuringUpload(application, server):
+    bulk_manager = QNetworkAccessManager()
+    control_manager = ControlNetworkManager("127.0.0.1", server.server_address[1])
+
+    upload_request = QNetworkRequest(_url(server, "/upload"))
+    upload_request.setHeader(QNetworkRequest.ContentTypeHeader, "application/octet-stream")
+    upload_reply = bulk_manager.post(upload_request, QByteArray(bytes(UPLOAD_SIZE)))
+    # Let the upload saturate the link
+    _waitFor(application, lambda: False, 0.5)
+    assert not upload_reply.isFinished()
+
+    request = QNetworkRequest(_url(server, "/?a=send"))
+    request.setHeader(QNetworkRequest.ContentTypeHeader, "application/x-www-form-urlencoded")
+    request.setPriority(QNetworkRequest.HighPriority)
+    sent_time = time.monotonic()
+    command_reply = control_manager.post(request, b"data={\"cmd\":\"@cancel\"}")
+    assert _waitFor(application, lambda: command_reply.isFinished(), 5)
+
+    latency = server.command_times[0] - sent_time
+    print("cancel-to-server latency during upload: %.1f ms" % (latency * 1000))
+    assert not upload_reply.isFinished(), "The upload finished before the command; the test does not measure anything"
+    assert latency < 0.5
+
+    upload_reply.abort()
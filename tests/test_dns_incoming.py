@@ -0,0 +1,133 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import socket
+import struct
+
+import pytest
+
+from zeroconf import (DNSAddress, DNSHinfo, DNSIncoming, DNSOutgoing, DNSPointer, DNSQuestion, DNSService, DNSText,
+                      _CLASS_IN, _CLASS_UNIQUE, _FLAGS_AA, _FLAGS_QR_RESPONSE, _TYPE_A, _TYPE_AAAA, _TYPE_HINFO,
+                      _TYPE_PTR, _TYPE_SRV, _TYPE_TXT)
+
+from dns_packets import SERVICE_TYPE, queryPacket, responsePacket, serviceRecords
+
+
+def _name(*labels: bytes) -> bytes:
+    return b"".join(bytes([len(label)]) + label for label in labels) + b"\x00"
+
+
+def _pointer(offset: int) -> bytes:
+    return bytes([0xC0 | offset >> 8, offset & 0xFF])
+
+
+def _header(questions: int = 0, answers: int = 0) -> bytes:
+    return struct.pack("!6H", 0, _FLAGS_QR_RESPONSE, questions, answers, 0, 0)
+
+
+def _record(type_: int, data: bytes) -> bytes:
+    return struct.pack("!HHiH", type_, _CLASS_IN, 120, len(data)) + data
+
+
+def test_responseRoundTrip():
+    records = serviceRecords(1) + serviceRecords(2)
+    msg = DNSIncoming(responsePacket([1, 2]))
+
+    assert msg.valid
+    assert msg.is_response()
+    assert msg.answers == records
+    for answer, record in zip(msg.answers, records):
+        assert answer.name == record.name
+        assert (answer.ttl, answer.unique) == (record.ttl, record.unique)
+    assert msg.answers[1].port == 3344
+    assert msg.answers[1].server == "printer-1.local."
+    assert msg.answers[2].text == records[2].text
+    assert msg.answers[3].address == socket.inet_aton("10.0.0.1")
+
+
+def test_queryRoundTrip():
+    msg = DNSIncoming(queryPacket([3, 4]))
+
+    assert msg.valid
+    assert msg.is_query()
+    assert [(question.name, question.type, question.class_) for question in msg.questions] == [(SERVICE_TYPE, _TYPE_PTR, _CLASS_IN)]
+    assert msg.answers == [serviceRecords(3)[0], serviceRecords(4)[0]]
+
+
+def test_otherRecordTypesRoundTrip():
+    out = DNSOutgoing(_FLAGS_QR_RESPONSE | _FLAGS_AA)
+    out.add_question(DNSQuestion("printer.local.", _TYPE_A, _CLASS_IN))
+    records = [
+        DNSAddress("printer.local.", _TYPE_AAAA, _CLASS_IN | _CLASS_UNIQUE, 120, socket.inet_pton(socket.AF_INET6, "fe80::1")),
+        DNSHinfo("printer.local.", _TYPE_HINFO, _CLASS_IN, 120, b"ARMV7L", b"LINUX"),
+        DNSService("Printer._http._tcp.local.", _TYPE_SRV, _CLASS_IN, 120, 1, 2, 80, "printer.local."),
+    ]
+    for record in records:
+        out.add_answer_at_time(record, 0)
+
+    msg = DNSIncoming(out.packet())
+    assert msg.valid
+    assert msg.questions[0].name == "printer.local."
+    assert msg.answers == records
+
+
+def test_compressedNamesAreDecoded():
+    packet = responsePacket([1, 2, 3])
+    # The names are compressed, so the decoder has to follow the pointers to earlier names
+    assert packet.count(b"_repetier") == 1
+    assert packet.count(b"local") == 1
+
+    msg = DNSIncoming(packet)
+    assert msg.answers == serviceRecords(1) + serviceRecords(2) + serviceRecords(3)
+
+
+def test_pointerIntoDecodedName():
+    # The second name points to the middle of the first one, and the third one to the second one
+    first = _name(b"Printer", b"_repetier", b"_tcp", b"local")
+    second = b"\x04host" + _pointer(12 + len(b"\x07Printer\x09_repetier"))
+    third = b"\x05other" + _pointer(12 + len(first) + 4)
+    packet = _header(questions = 3) + first + b"\x00\x0c\x00\x01" + second + b"\x00\x01\x00\x01" + third + b"\x00\x01\x00\x01"
+
+    msg = DNSIncoming(packet)
+    assert msg.valid
+    assert [question.name for question in msg.questions] == ["Printer._repetier._tcp.local.", "host._tcp.local.", "other.host._tcp.local."]
+
+
+def test_pointerToNameThatWasNotDecoded():
+    # A name in the data of an unknown record type is only decoded when a pointer leads to it
+    txt_name = _name(b"printer", b"local")
+    packet = _header(answers = 2) + _name(b"hidden") + _record(99, txt_name)
+    packet += _pointer(12 + len(_name(b"hidden")) + 10) + _record(_TYPE_A, socket.inet_aton("10.0.0.9"))
+
+    msg = DNSIncoming(packet)
+    assert msg.valid
+    assert [(record.name, record.type) for record in msg.answers] == [("printer.local.", _TYPE_A)]
+
+
+def test_namesAreKeptPerPacket():
+    DNSIncoming(responsePacket([1]))
+    msg = DNSIncoming(responsePacket([2]))
+    assert msg.answers == serviceRecords(2)
+
+
+@pytest.mark.parametrize("length", [5, 12, 20, 40, 100])
+def test_truncatedPacketIsInvalid(length):
+    msg = DNSIncoming(responsePacket([1])[:length])
+    assert not msg.valid
+
+
+def test_circularPointerIsInvalid():
+    packet = _header(questions = 1) + b"\x04loop" + _pointer(12) + b"\x00\x01\x00\x01"
+    msg = DNSIncoming(packet)
+    assert not msg.valid
+    assert msg.questions == []
+
+
+def test_forwardPointerIsInvalid():
+    packet = _header(questions = 1) + _pointer(20) + b"\x00\x01\x00\x01" + _name(b"local")
+    assert not DNSIncoming(packet).valid
+
+
+def test_badLabelTypeIsInvalid():
+    packet = _header(questions = 1) + b"\x45local\x00\x00\x01\x00\x01"
+    assert not DNSIncoming(packet).valid
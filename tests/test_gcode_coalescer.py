@@ -0,0 +1,61 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import pytest
+
+from GcodeCoalescer import coalesceGcode
+
+
+def test_relativeJogsAreMerged():
+    assert coalesceGcode(["G91", "G1 X10", "G1 X-2.5", "G90"]) == ["G91", "G1 X7.5", "G90"]
+
+
+@pytest.mark.parametrize("absolute", ["G90", "g90", "G90 ; back to absolute", " g90;abs"])
+def test_absoluteMovesAfterCommentedG90AreKept(absolute):
+    commands = ["G91", "G1 X10", absolute, "G1 X10", "G1 X10"]
+    assert coalesceGcode(commands) == commands
+
+
+@pytest.mark.parametrize("relative", ["G91", "g91", "G91 ; jog", " g91;jog"])
+def test_relativeMovesAfterCommentedG91AreMerged(relative):
+    assert coalesceGcode(["G90", relative, "G1 Y1", "G1 Y1"]) == ["G90", relative, "G1 Y2"]
+
+
+def test_redundantModeSwitchIsDropped():
+    assert coalesceGcode(["G91", "G1 Z1", "g90 ; abs", "G91", "G1 Z1"]) == ["G91", "G1 Z2"]
+
+
+def test_setpointsKeepTheLatestValue():
+    assert coalesceGcode(["M104 S200", "M140 S60", "M104 S210", "M104 T1 S190"]) == ["M140 S60", "M104 S210", "M104 T1 S190"]
+    assert coalesceGcode(["M106 S255", "M107"]) == ["M107"]
+
+
+def test_movesWithExtrusionAreNotMerged():
+    commands = ["G91", "G1 E5", "G1 E5"]
+    assert coalesceGcode(commands) == commands
+
+
+@pytest.mark.parametrize("moves, merged", [
+    (["G1 X0.00001", "G1 X0.00001"], "G1 X0.00002"),
+    (["G1 X600000", "G1 X400000"], "G1 X1000000"),
+    (["G1 Z1.234567", "G1 Z0.0000001"], "G1 Z1.2345671"),
+    (["G1 Y1.50", "G1 Y1.50"], "G1 Y3"),
+    (["G1 X0.1", "G1 X0.2"], "G1 X0.3"),
+])
+def test_mergedDistancesAreExactWithoutExponent(moves, merged):
+    assert coalesceGcode(["G91"] + moves) == ["G91", merged]
+
+
+def test_movesThatCancelOutAreDropped():
+    assert coalesceGcode(["G91", "G1 X10", "G1 X-10", "G90"]) == ["G91", "G90"]
+    assert coalesceGcode(["G91", "G1 X0.1", "G1 X-0.1", "G1 X5"]) == ["G91", "G1 X5"]
+    assert coalesceGcode(["G91", "G1 X10 Y1", "G1 X-10 Y1"]) == ["G91", "G1 Y2"]
+
+
+def test_feedrateOfMovesThatCancelOutIsKept():
+    assert coalesceGcode(["G91", "G1 X10 F3000", "G1 X-10"]) == ["G91", "G1 F3000"]
+
+
+def test_invalidDistancesAreNotMerged():
+    commands = ["G91", "G1 XNAN", "G1 X1", "G1 Xabc", "G1 X1"]
+    assert coalesceGcode(commands) == commands
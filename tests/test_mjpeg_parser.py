@@ -0,0 +1,108 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import random
+
+import pytest
+
+from MJPEGStreamParser import MJPEGStreamParser
+
+from mjpeg_streams import BOUNDARY, chunkStream, chunkStreamAtMarkers, garbage, generateStream, jpegFrame, parse
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("mode", ["markers", "multipart", "multipart-nolength"])
+def test_framesInRandomChunks(mode, seed):
+    rng = random.Random(seed)
+    frames, stream = generateStream(rng, rng.randrange(1, 20), mode)
+
+    boundary = BOUNDARY if mode != "markers" else None
+    assert parse(MJPEGStreamParser(), chunkStream(stream, rng), boundary) == frames
+
+
+@pytest.mark.parametrize("mode", ["markers", "multipart", "multipart-nolength"])
+def test_markersSplitBetweenChunks(mode):
+    rng = random.Random(1)
+    frames, stream = generateStream(rng, 10, mode, max_size = 2000)
+
+    boundary = BOUNDARY if mode != "markers" else None
+    assert parse(MJPEGStreamParser(), chunkStreamAtMarkers(stream), boundary) == frames
+
+
+def test_thumbnailDoesNotEndFrame():
+    rng = random.Random(2)
+    frame = jpegFrame(5000, rng, thumbnail = True)
+    assert frame.count(b"\xff\xd9") == 2
+
+    assert parse(MJPEGStreamParser(), [frame, frame]) == [frame, frame]
+    assert parse(MJPEGStreamParser(), chunkStream(frame * 3, rng, max_chunk_size = 16)) == [frame] * 3
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_garbageBetweenFrames(seed):
+    rng = random.Random(seed)
+    frames, stream = generateStream(rng, 15, garbage_size = 500)
+
+    assert parse(MJPEGStreamParser(), chunkStream(stream, rng)) == frames
+
+
+def test_strayStartMarkerWithBogusSegmentLength():
+    # A start marker in garbage data that is followed by what looks like a 64 kB segment, which
+    # must not swallow the frames that follow it
+    rng = random.Random(3)
+    frames, stream = generateStream(rng, 40, max_size = 5000, thumbnails = 0.5)
+    stream = garbage(100, rng) + b"\xff\xd8\xff\xe0\xff\xff" + garbage(10, rng) + stream
+
+    parser = MJPEGStreamParser()
+    assert parse(parser, chunkStream(stream, rng)) == frames
+    assert parse(MJPEGStreamParser(), [stream]) == frames
+    assert parser.resyncs >= 1
+
+
+def test_strayStartMarkerWithoutSegments():
+    rng = random.Random(4)
+    frames, stream = generateStream(rng, 5, max_size = 1000)
+    stream = b"\x00\xff\xd8\x12\x34" + stream
+
+    assert parse(MJPEGStreamParser(), chunkStream(stream, rng)) == frames
+
+
+def test_oversizedFrameIsSkipped():
+    rng = random.Random(5)
+    small_frame = jpegFrame(1000, rng)
+    large_frame = jpegFrame(20000, rng)
+
+    parser = MJPEGStreamParser(max_buffer_size = 10000)
+    frames = parse(parser, chunkStream(small_frame + large_frame + small_frame, rng, max_chunk_size = 1000))
+    assert frames == [small_frame, small_frame]
+    assert parser.resyncs == 1
+    assert parser.bufferSize <= 10000
+
+
+def test_bufferOnlyHoldsPartialFrame():
+    rng = random.Random(6)
+    frames, stream = generateStream(rng, 10, max_size = 3000)
+    parser = MJPEGStreamParser()
+
+    parse(parser, [stream[:-10]])
+    assert parser.framesFound == 9
+    assert parser.bufferSize == len(frames[-1]) - 10
+    assert parser.bytesReceived == len(stream) - 10
+
+
+def test_unknownBoundaryFallsBackToMarkers():
+    rng = random.Random(7)
+    frames, stream = generateStream(rng, 40, max_size = 60000)
+
+    # Frames are only looked for by their markers after a while; from then on all frames are found
+    found = parse(MJPEGStreamParser(), chunkStream(stream, rng), b"notinthestream")
+    assert found
+    assert found == frames[-len(found):]
+    # The frame that was being received when the parser switched over is lost as well
+    assert sum(len(frame) for frame in frames[:-len(found) - 1]) < MJPEGStreamParser.MAX_BOUNDARY_SEARCH
+
+
+def test_boundaryFromContentType():
+    assert MJPEGStreamParser.boundaryFromContentType("multipart/x-mixed-replace; boundary=frame") == b"frame"
+    assert MJPEGStreamParser.boundaryFromContentType("multipart/x-mixed-replace;boundary=\"--my frame\"") == b"--my frame"
+    assert MJPEGStreamParser.boundaryFromContentType(b"image/jpeg") is None
@@ -0,0 +1,76 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import pytest
+
+pytest.importorskip("PyQt5.QtNetwork")
+
+from PyQt5.QtNetwork import QNetworkRequest, QSslSocket
+
+from RepetierRequestFactory import RepetierRequestFactory
+
+BASE_URL = "http://printer.local:3344/"
+
+
+def _factory(basic_auth_data = None):
+    factory = RepetierRequestFactory(BASE_URL + "printer/api/vmaxx", BASE_URL + "printer/job/vmaxx", BASE_URL + "printer/model/vmaxx", "Cura/4.8 RepetierIntegration/1.0", basic_auth_data)
+    factory.setApiKey("secret")
+    return factory
+
+
+def test_requestHasHeadersAndSslConfiguration():
+    request = _factory(b"basic dXNlcjpwYXNz").createRequest("stateList")
+
+    assert request.url().toString() == BASE_URL + "printer/api/vmaxx?a=stateList"
+    assert request.rawHeader(b"X-Api-Key") == b"secret"
+    assert request.rawHeader(b"User-Agent") == b"Cura/4.8 RepetierIntegration/1.0"
+    assert request.rawHeader(b"Authorization") == b"basic dXNlcjpwYXNz"
+    assert request.header(QNetworkRequest.ContentTypeHeader) == "application/json"
+    assert request.attribute(QNetworkRequest.FollowRedirectsAttribute)
+    assert request.sslConfiguration().peerVerifyMode() == QSslSocket.VerifyNone
+
+
+def test_noAuthorizationWithoutBasicAuthData():
+    request = _factory().createRequest("stateList", content_type = None)
+
+    assert not request.hasRawHeader(b"Authorization")
+    assert request.header(QNetworkRequest.ContentTypeHeader) is None
+
+
+def test_uploadsGoToJobOrModelEndPoint():
+    factory = _factory()
+
+    request = factory.createRequest("upload&name=benchy.gcode")
+    assert request.url().toString() == BASE_URL + "printer/job/vmaxx?a=upload&name=benchy.gcode"
+    assert request.priority() == QNetworkRequest.LowPriority
+
+    request = factory.createRequest("upload&name=benchy.gcode", save_upload = True)
+    assert request.url().toString() == BASE_URL + "printer/model/vmaxx?a=upload&name=benchy.gcode"
+
+
+def test_requestsAreIndependentCopies():
+    factory = _factory()
+    request = factory.createRequest("send")
+    request.setPriority(QNetworkRequest.HighPriority)
+    request.setRawHeader(b"X-Api-Key", b"changed")
+
+    other_request = factory.createRequest("send")
+    assert other_request.priority() == QNetworkRequest.NormalPriority
+    assert other_request.rawHeader(b"X-Api-Key") == b"secret"
+    assert not factory.getTemplate().hasRawHeader(b"Content-Type")
+
+
+def test_setApiKeyInvalidatesTemplateAndUrls():
+    factory = _factory()
+    template = factory.getTemplate()
+    factory.createRequest("stateList")
+    assert factory._urls
+
+    factory.setApiKey("other secret")
+    assert factory._template is None
+    assert factory._urls == {}
+
+    assert factory.getTemplate() is not template
+    request = factory.createRequest("stateList")
+    assert request.rawHeader(b"X-Api-Key") == b"other secret"
+    assert request.url().toString() == BASE_URL + "printer/api/vmaxx?a=stateList"
@@ -0,0 +1,162 @@
+# Copyright (c) 2020 Aldo Hoeben / fieldOfView & Shane Bumpurs
+# The tests are released under the terms of the LGPLv3 or higher.
+
+import importlib
+import os
+import sys
+import time
+import types
+
+import pytest
+
+pytest.importorskip("PyQt5.QtCore")
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop
+
+from zeroconf import DNSOutgoing, DNSPointer, _CLASS_IN, _FLAGS_AA, _FLAGS_QR_RESPONSE, _TYPE_PTR
+
+from dns_packets import SERVICE_TYPE, responsePacket
+
+plugin_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ZeroconfDriver imports zeroconf relative to the plugin package, but the __init__ of the plugin
+# needs Cura, so the modules are imported from a package that does not run it
+def _importPluginModule(name: str) -> types.ModuleType:
+    if "RepetierIntegration" not in sys.modules:
+        package = types.ModuleType("RepetierIntegration")
+        package.__path__ = [plugin_path]
+        sys.modules["RepetierIntegration"] = package
+    return importlib.import_module("RepetierIntegration." + name)
+
+
+# Stands in for the notifier on the multicast socket; the test signals when there is data
+class _FakeSocketNotifier:
+    Read = 0
+
+    def __init__(self, socket: int, type_: int) -> None:
+        self.socket = socket
+        self.enabled = True
+        self._callbacks = []
+        self.activated = self
+
+    def connect(self, callback) -> None:
+        self._callbacks.append(callback)
+
+    def emit(self, socket: int) -> None:
+        if self.enabled:
+            for callback in self._callbacks:
+                callback(socket)
+
+    def setEnabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+
+
+# Hands out queued packets as if they were received on the multicast socket
+class _PacketSocket:
+    def __init__(self, socket) -> None:
+        self._socket = socket
+        self.packets = []
+
+    def recvfrom(self, size: int):
+        return self.packets.pop(0), ("192.168.1.10", 5353)
+
+    def fileno(self) -> int:
+        return self._socket.fileno()
+
+    def close(self) -> None:
+        self._socket.close()
+
+
+def _goodbyePacket(index: int) -> bytes:
+    out = DNSOutgoing(_FLAGS_QR_RESPONSE | _FLAGS_AA)
+    out.add_answer_at_time(DNSPointer(SERVICE_TYPE, _TYPE_PTR, _CLASS_IN, 0, "Printer %d.%s" % (index, SERVICE_TYPE)), 0)
+    return out.packet()
+
+
+def _shortLivedPacket(index: int) -> bytes:
+    out = DNSOutgoing(_FLAGS_QR_RESPONSE | _FLAGS_AA)
+    out.add_answer_at_time(DNSPointer(SERVICE_TYPE, _TYPE_PTR, _CLASS_IN, 1, "Printer %d.%s" % (index, SERVICE_TYPE)), 0)
+    return out.packet()
+
+
+@pytest.fixture
+def application():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def driver(application, monkeypatch):
+    driver_module = _importPluginModule("ZeroconfDriver")
+    monkeypatch.setattr(driver_module, "QSocketNotifier", _FakeSocketNotifier)
+
+    driver = driver_module.ZeroconfDriver(["127.0.0.1"])
+    zeroconf = driver.getZeroconf()
+    zeroconf._listen_socket = _PacketSocket(zeroconf.listen_socket)
+    yield driver
+    driver.close()
+
+
+@pytest.fixture
+def changes(driver):
+    changes = []
+    service_state_change = _importPluginModule("zeroconf").ServiceStateChange
+
+    def onServiceChanged(zeroconf, service_type, name, state_change):
+        assert zeroconf is driver.getZeroconf()
+        changes.append((name, "added" if state_change is service_state_change.Added else "removed"))
+
+    driver.addServiceBrowser(SERVICE_TYPE, [onServiceChanged])
+    return changes
+
+
+def _receive(driver, packet: bytes) -> None:
+    driver.getZeroconf().listen_socket.packets.append(packet)
+    driver._socket_notifier.activated.emit(driver._socket_notifier.socket)
+
+
+def _processEvents(application, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        application.processEvents(QEventLoop.AllEvents, 10)
+
+
+def test_zeroconfIsNotThreaded(driver):
+    zeroconf = driver.getZeroconf()
+    assert not zeroconf.threaded
+    assert zeroconf.engine is None and zeroconf.reaper is None
+    assert driver._socket_notifier.socket == zeroconf.listen_socket.fileno()
+
+
+def test_handlersAreCalledWhenPacketIsRead(driver, changes):
+    _receive(driver, responsePacket([1, 2]))
+
+    assert changes == [("Printer 1." + SERVICE_TYPE, "added"), ("Printer 2." + SERVICE_TYPE, "added")]
+    assert driver.getZeroconf().cache.entries_with_name("printer-1.local.")
+
+
+def test_goodbyeRemovesService(driver, changes):
+    _receive(driver, responsePacket([1]))
+    _receive(driver, _goodbyePacket(1))
+
+    assert changes == [("Printer 1." + SERVICE_TYPE, "added"), ("Printer 1." + SERVICE_TYPE, "removed")]
+
+
+def test_expiredServiceIsRemovedByPollTimer(application, driver, changes):
+    _receive(driver, _shortLivedPacket(3))
+    assert changes == [("Printer 3." + SERVICE_TYPE, "added")]
+    assert driver._poll_timer.isActive()
+
+    _processEvents(application, 1.5)
+    assert changes == [("Printer 3." + SERVICE_TYPE, "added"), ("Printer 3." + SERVICE_TYPE, "removed")]
+
+
+def test_closeStopsDriver(driver, changes):
+    driver.close()
+
+    assert driver.getZeroconf().done
+    assert not driver._poll_timer.isActive()
+    assert not driver._socket_notifier.enabled
+
+    driver._onSocketActivated(0)
+    assert changes == []
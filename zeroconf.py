@@ -25,15 +25,16 @@ from __future__ import (
 
 import enum
 import errno
+import heapq
+import itertools
 import logging
 import re
-import select
+import selectors
 import socket
 import struct
 import sys
 import threading
 import time
-from functools import reduce
 
 import netifaces
 from six import binary_type, indexbytes, int2byte, iteritems, text_type
@@ -361,7 +362,7 @@ class DNSEntry(object):
     def __eq__(self, other):
         """Equality test on name, type, and class"""
         return (isinstance(other, DNSEntry) and
-                self.name == other.name and
+                self.key == other.key and
                 self.type == other.type and
                 self.class_ == other.class_)
 
@@ -369,6 +370,10 @@ class DNSEntry(object):
         """Non-equality test"""
         return not self.__eq__(other)
 
+    def __hash__(self):
+        """Hash on name, type, and class"""
+        return hash((self.key, self.type, self.class_))
+
     @staticmethod
     def get_class_(class_):
         """Class accessor"""
@@ -487,7 +492,12 @@ class DNSAddress(DNSRecord):
 
     def __eq__(self, other):
         """Tests equality on address"""
-        return isinstance(other, DNSAddress) and self.address == other.address
+        return (isinstance(other, DNSAddress) and
+                DNSEntry.__eq__(self, other) and
+                self.address == other.address)
+
+    def __hash__(self):
+        return hash((self.key, self.type, self.class_, self.address))
 
     def __repr__(self):
         """String representation"""
@@ -520,8 +530,12 @@ class DNSHinfo(DNSRecord):
     def __eq__(self, other):
         """Tests equality on cpu and os"""
         return (isinstance(other, DNSHinfo) and
+                DNSEntry.__eq__(self, other) and
                 self.cpu == other.cpu and self.os == other.os)
 
+    def __hash__(self):
+        return hash((self.key, self.type, self.class_, self.cpu, self.os))
+
     def __repr__(self):
         """String representation"""
         return self.cpu + " " + self.os
@@ -541,7 +555,12 @@ class DNSPointer(DNSRecord):
 
     def __eq__(self, other):
         """Tests equality on alias"""
-        return isinstance(other, DNSPointer) and self.alias == other.alias
+        return (isinstance(other, DNSPointer) and
+                DNSEntry.__eq__(self, other) and
+                self.alias == other.alias)
+
+    def __hash__(self):
+        return hash((self.key, self.type, self.class_, self.alias))
 
     def __repr__(self):
         """String representation"""
@@ -563,7 +582,12 @@ class DNSText(DNSRecord):
 
     def __eq__(self, other):
         """Tests equality on text"""
-        return isinstance(other, DNSText) and self.text == other.text
+        return (isinstance(other, DNSText) and
+                DNSEntry.__eq__(self, other) and
+                self.text == other.text)
+
+    def __hash__(self):
+        return hash((self.key, self.type, self.class_, self.text))
 
     def __repr__(self):
         """String representation"""
@@ -595,16 +619,28 @@ class DNSService(DNSRecord):
     def __eq__(self, other):
         """Tests equality on priority, weight, port and server"""
         return (isinstance(other, DNSService) and
+                DNSEntry.__eq__(self, other) and
                 self.priority == other.priority and
                 self.weight == other.weight and
                 self.port == other.port and
                 self.server == other.server)
 
+    def __hash__(self):
+        return hash((self.key, self.type, self.class_,
+                     self.priority, self.weight, self.port, self.server))
+
     def __repr__(self):
         """String representation"""
         return self.to_string("%s:%s" % (self.server, self.port))
 
 
+_HEADER = struct.Struct(b'!6H')
+_QUESTION = struct.Struct(b'!HH')
+_RECORD = struct.Struct(b'!HHiH')
+_UNSIGNED_SHORT = struct.Struct(b'!H')
+_UNSIGNED_INT = struct.Struct(b'!I')
+
+
 class DNSIncoming(QuietLogger):
 
     """Object representation of an incoming DNS packet"""
@@ -613,6 +649,7 @@ class DNSIncoming(QuietLogger):
         """Constructor from string holding bytes of packet"""
         self.offset = 0
         self.data = data
+        self._names = {}  # maps offsets of names in the packet to names
         self.questions = []
         self.answers = []
         self.id = 0
@@ -634,22 +671,25 @@ class DNSIncoming(QuietLogger):
                 'Choked at offset %d while unpacking %r', self.offset, data))
 
     def unpack(self, format_):
-        length = struct.calcsize(format_)
-        info = struct.unpack(
-            format_, self.data[self.offset:self.offset + length])
-        self.offset += length
+        return self.unpack_struct(struct.Struct(format_))
+
+    def unpack_struct(self, struct_):
+        """Unpacks a precompiled struct at the current offset"""
+        info = struct_.unpack_from(self.data, self.offset)
+        self.offset += struct_.size
         return info
 
     def read_header(self):
         """Reads header portion of packet"""
         (self.id, self.flags, self.num_questions, self.num_answers,
-         self.num_authorities, self.num_additionals) = self.unpack(b'!6H')
+         self.num_authorities, self.num_additionals) = \
+            self.unpack_struct(_HEADER)
 
     def read_questions(self):
         """Reads questions section of packet"""
         for i in xrange(self.num_questions):
             name = self.read_name()
-            type_, class_ = self.unpack(b'!HH')
+            type_, class_ = self.unpack_struct(_QUESTION)
 
             question = DNSQuestion(name, type_, class_)
             self.questions.append(question)
@@ -672,7 +712,7 @@ class DNSIncoming(QuietLogger):
 
     def read_unsigned_short(self):
         """Reads an unsigned short from the packet"""
-        return self.unpack(b'!H')[0]
+        return self.unpack_struct(_UNSIGNED_SHORT)[0]
 
     def read_others(self):
         """Reads the answers, authorities and additionals section of the
@@ -680,7 +720,7 @@ class DNSIncoming(QuietLogger):
         n = self.num_answers + self.num_authorities + self.num_additionals
         for i in xrange(n):
             domain = self.read_name()
-            type_, class_, ttl, length = self.unpack(b'!HHiH')
+            type_, class_, ttl, length = self.unpack_struct(_RECORD)
 
             rec = None
             if type_ == _TYPE_A:
@@ -726,8 +766,13 @@ class DNSIncoming(QuietLogger):
         return text_type(self.data[offset:offset + length], 'utf-8', 'replace')
 
     def read_name(self):
-        """Reads a domain name from the packet"""
-        result = ''
+        """Reads a domain name from the packet
+
+        The names at the offsets of all labels that are read are kept,
+        so names that are pointed to by compressed names are decoded
+        only once per packet."""
+        labels = []
+        label_offsets = []  # offsets of the labels, and their index
         off = self.offset
         next_ = -1
         first = off
@@ -739,7 +784,8 @@ class DNSIncoming(QuietLogger):
                 break
             t = length & 0xC0
             if t == 0x00:
-                result = ''.join((result, self.read_utf(off, length) + '.'))
+                label_offsets.append((off - 1, len(labels)))
+                labels.append(self.read_utf(off, length) + '.')
                 off += length
             elif t == 0xC0:
                 if next_ < 0:
@@ -749,6 +795,10 @@ class DNSIncoming(QuietLogger):
                     raise IncomingDecodeError(
                         "Bad domain name (circular) at %s" % (off,))
                 first = off
+                name = self._names.get(off)
+                if name is not None:
+                    labels.append(name)
+                    break
             else:
                 raise IncomingDecodeError("Bad domain name at %s" % (off,))
 
@@ -757,27 +807,51 @@ class DNSIncoming(QuietLogger):
         else:
             self.offset = off
 
-        return result
+        for label_offset, index in label_offsets:
+            self._names[label_offset] = ''.join(labels[index:])
+        return ''.join(labels)
 
 
 class DNSOutgoing(object):
 
-    """Object representation of an outgoing packet"""
+    """Object representation of an outgoing packet
+
+    The packet is written to a single bytearray, which starts with room
+    for the header; the header is filled in when the packet is done."""
 
     def __init__(self, flags, multicast=True):
         self.finished = False
         self.id = 0
         self.multicast = multicast
         self.flags = flags
-        self.names = {}
-        self.data = []
-        self.size = 12
+        self.names = {}  # maps names in the packet to their offset
+        self.data = bytearray(_HEADER.size)
         self.state = self.State.init
 
         self.questions = []
         self.answers = []
         self.authorities = []
         self.additionals = []
+        self.written_questions = 0
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def copy(self):
+        """Returns a copy of a packet that is not done yet.  Questions
+        that were written with write_questions() are not written again,
+        so a query can be prepared once and sent with different answers."""
+        out = DNSOutgoing(self.flags, self.multicast)
+        out.id = self.id
+        out.names = dict(self.names)
+        out.data = bytearray(self.data)
+        out.questions = list(self.questions)
+        out.answers = list(self.answers)
+        out.authorities = list(self.authorities)
+        out.additionals = list(self.additionals)
+        out.written_questions = self.written_questions
+        return out
 
     def __repr__(self):
         return '<DNSOutgoing:{%s}>' % ', '.join([
@@ -851,31 +925,28 @@ class DNSOutgoing(object):
         self.additionals.append(record)
 
     def pack(self, format_, value):
-        self.data.append(struct.pack(format_, value))
-        self.size += struct.calcsize(format_)
+        self.data += struct.pack(format_, value)
 
     def write_byte(self, value):
         """Writes a single byte to the packet"""
-        self.pack(b'!c', int2byte(value))
+        self.data.append(value)
 
-    def insert_short(self, index, value):
-        """Inserts an unsigned short in a certain position in the packet"""
-        self.data.insert(index, struct.pack(b'!H', value))
-        self.size += 2
+    def write_short_at(self, offset, value):
+        """Writes an unsigned short at a certain offset in the packet"""
+        _UNSIGNED_SHORT.pack_into(self.data, offset, value)
 
     def write_short(self, value):
         """Writes an unsigned short to the packet"""
-        self.pack(b'!H', value)
+        self.data += _UNSIGNED_SHORT.pack(value)
 
     def write_int(self, value):
         """Writes an unsigned integer to the packet"""
-        self.pack(b'!I', int(value))
+        self.data += _UNSIGNED_INT.pack(int(value))
 
     def write_string(self, value):
         """Writes a string to the packet"""
         assert isinstance(value, bytes)
-        self.data.append(value)
-        self.size += len(value)
+        self.data += value
 
     def write_utf(self, s):
         """Writes a UTF-8 string of a given length to the packet"""
@@ -916,19 +987,16 @@ class DNSOutgoing(object):
         name_suffices = ['.'.join(parts[i:]) for i in range(len(parts))]
 
         # look for an existing name or suffix
-        for count, sub_name in enumerate(name_suffices):
+        count = len(name_suffices)
+        for i, sub_name in enumerate(name_suffices):
             if sub_name in self.names:
+                count = i
                 break
-        else:
-            count += 1
-
-        # note the new names we are saving into the packet
-        for suffix in name_suffices[:count]:
-            self.names[suffix] = self.size + len(name) - len(suffix) - 1
 
-        # write the new names out.
-        for part in parts[:count]:
-            self.write_utf(part)
+        # write the new names out, noting where each of them starts
+        for i in range(count):
+            self.names[name_suffices[i]] = len(self.data)
+            self.write_utf(parts[i])
 
         # if we wrote part of the name, create a pointer to the rest
         if count != len(name_suffices):
@@ -952,7 +1020,7 @@ class DNSOutgoing(object):
         if self.state == self.State.finished:
             return 1
 
-        start_data_length, start_size = len(self.data), self.size
+        start_size = len(self.data)
         self.write_name(record.name)
         self.write_short(record.type)
         if record.unique and self.multicast:
@@ -963,26 +1031,26 @@ class DNSOutgoing(object):
             self.write_int(record.ttl)
         else:
             self.write_int(record.get_remaining_ttl(now))
+        # Leave room for the length of the record data
         index = len(self.data)
-
-        # Adjust size for the short we will write before this record
-        self.size += 2
+        self.write_short(0)
         record.write(self)
-        self.size -= 2
-
-        length = sum((len(d) for d in self.data[index:]))
-        # Here is the short we adjusted for
-        self.insert_short(index, length)
+        self.write_short_at(index, len(self.data) - index - 2)
 
         # if we go over, then rollback and quit
-        if self.size > _MAX_MSG_ABSOLUTE:
-            while len(self.data) > start_data_length:
-                self.data.pop()
-            self.size = start_size
+        if len(self.data) > _MAX_MSG_ABSOLUTE:
+            del self.data[start_size:]
             self.state = self.State.finished
             return 1
         return 0
 
+    def write_questions(self):
+        """Writes the questions that were not written yet to the packet.
+        No answers should be written before this is done."""
+        for question in self.questions[self.written_questions:]:
+            self.write_question(question)
+        self.written_questions = len(self.questions)
+
     def packet(self):
         """Returns a string containing the packet's bytes
 
@@ -992,8 +1060,7 @@ class DNSOutgoing(object):
         overrun_answers, overrun_authorities, overrun_additionals = 0, 0, 0
 
         if self.state != self.State.finished:
-            for question in self.questions:
-                self.write_question(question)
+            self.write_questions()
             for answer, time_ in self.answers:
                 overrun_answers += self.write_record(answer, time_)
             for authority in self.authorities:
@@ -1002,47 +1069,84 @@ class DNSOutgoing(object):
                 overrun_additionals += self.write_record(additional, 0)
             self.state = self.State.finished
 
-            self.insert_short(0, len(self.additionals) - overrun_additionals)
-            self.insert_short(0, len(self.authorities) - overrun_authorities)
-            self.insert_short(0, len(self.answers) - overrun_answers)
-            self.insert_short(0, len(self.questions))
-            self.insert_short(0, self.flags)
-            if self.multicast:
-                self.insert_short(0, 0)
-            else:
-                self.insert_short(0, self.id)
-        return b''.join(self.data)
+            _HEADER.pack_into(
+                self.data, 0,
+                0 if self.multicast else self.id,
+                self.flags,
+                len(self.questions),
+                len(self.answers) - overrun_answers,
+                len(self.authorities) - overrun_authorities,
+                len(self.additionals) - overrun_additionals)
+        return bytes(self.data)
 
 
 class DNSCache(object):
 
-    """A cache of DNS entries"""
+    """A cache of DNS entries
+
+    Entries are indexed by name, and then by the entry itself, which
+    hashes on its name, type, class and data, so looking up, refreshing
+    and removing a record does not depend on the size of the cache.
+
+    The expiration times of the entries are kept in a heap, so expired
+    entries can be found without going through the whole cache."""
 
     def __init__(self):
-        self.cache = {}
+        self.cache = {}  # maps name to a dict of records with that name
+        self._expirations = []  # heap of (expiration time, sequence, record)
+        self._scheduled = {}  # maps records to their time in the heap
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # changes whenever a service (SRV) record is added or removed
+        self.services_version = 0
 
     def add(self, entry):
         """Adds an entry"""
-        self.cache.setdefault(entry.key, []).append(entry)
+        with self._lock:
+            self.cache.setdefault(entry.key, {})[entry] = entry
+            self._schedule(entry)
+            if entry.type == _TYPE_SRV:
+                self.services_version += 1
 
     def remove(self, entry):
         """Removes an entry"""
-        try:
-            list_ = self.cache[entry.key]
-            list_.remove(entry)
-        except (KeyError, ValueError):
-            pass
+        with self._lock:
+            entries = self.cache.get(entry.key)
+            if entries is None:
+                return
+            if entries.pop(entry, None) is not None and \
+                    entry.type == _TYPE_SRV:
+                self.services_version += 1
+            self._scheduled.pop(entry, None)
+            if not entries:
+                self.cache.pop(entry.key, None)
+
+    def refresh(self, entry, other):
+        """Sets the TTL of an entry to that of another record"""
+        with self._lock:
+            entry.reset_ttl(other)
+            # Entries that expire later than scheduled are rescheduled
+            # when they come up
+            if (entry.get_expiration_time(100) <
+                    self._scheduled.get(entry, float("inf"))):
+                self._schedule(entry)
 
     def get(self, entry):
         """Gets an entry by key.  Will return None if there is no
         matching entry."""
-        try:
-            list_ = self.cache[entry.key]
-            for cached_entry in list_:
-                if entry.__eq__(cached_entry):
-                    return cached_entry
-        except (KeyError, ValueError):
+        entries = self.cache.get(entry.key)
+        if not entries:
             return None
+        if isinstance(entry, DNSRecord):
+            return entries.get(entry)
+        # Entries without data match any record with their name, type and class
+        for cached_entry in list(entries.values()):
+            if DNSEntry.__eq__(entry, cached_entry):
+                return cached_entry
+        return None
+
+    def __contains__(self, entry):
+        return self.get(entry) is not None
 
     def get_by_details(self, name, type_, class_):
         """Gets an entry by details.  Will return None if there is
@@ -1052,10 +1156,7 @@ class DNSCache(object):
 
     def entries_with_name(self, name):
         """Returns a list of entries whose key matches the name."""
-        try:
-            return self.cache[name.lower()]
-        except KeyError:
-            return []
+        return list(self.cache.get(name.lower(), {}).values())
 
     def current_entry_with_name_and_alias(self, name, alias):
         now = current_time_millis()
@@ -1067,12 +1168,38 @@ class DNSCache(object):
 
     def entries(self):
         """Returns a list of all entries"""
-        if not self.cache:
-            return []
-        else:
-            # avoid size change during iteration by copying the cache
-            values = list(self.cache.values())
-            return reduce(lambda a, b: a + b, values)
+        # avoid size change during iteration by copying the cache
+        return [entry for entries in list(self.cache.values())
+                for entry in list(entries.values())]
+
+    def next_expiration_time(self):
+        """Returns the time at which the next entry may expire, or
+        None if the cache is empty."""
+        with self._lock:
+            return self._expirations[0][0] if self._expirations else None
+
+    def expired_entries(self, now):
+        """Returns the entries that have expired.  Only entries that
+        are due are looked at."""
+        expired = []
+        with self._lock:
+            while self._expirations and self._expirations[0][0] <= now:
+                time_, _, entry = heapq.heappop(self._expirations)
+                if self._scheduled.get(entry) != time_ or \
+                        self.get(entry) is not entry:
+                    continue  # removed or rescheduled since
+                if entry.is_expired(now):
+                    del self._scheduled[entry]
+                    expired.append(entry)
+                else:
+                    self._schedule(entry)
+        return expired
+
+    def _schedule(self, entry):
+        time_ = entry.get_expiration_time(100)
+        self._scheduled[entry] = time_
+        heapq.heappush(
+            self._expirations, (time_, next(self._sequence), entry))
 
 
 class Engine(threading.Thread):
@@ -1086,6 +1213,11 @@ class Engine(threading.Thread):
 
     Writers are not implemented here, because we only send short
     packets.
+
+    The engine waits on a selector, which also watches one end of a
+    socket pair.  Writing to the other end wakes the engine up right
+    away, so it picks up changes to the readers, and stops as soon as
+    zeroconf is closed.
     """
 
     def __init__(self, zc):
@@ -1094,42 +1226,70 @@ class Engine(threading.Thread):
         self.zc = zc
         self.readers = {}  # maps socket to reader
         self.timeout = 5
-        self.condition = threading.Condition()
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        # A socket pair rather than a pipe, because on Windows only
+        # sockets can be selected
+        self._wakeup_socket, self._wakeup_trigger = socket.socketpair()
+        self._wakeup_socket.setblocking(False)
+        self._wakeup_trigger.setblocking(False)
+        self.selector.register(self._wakeup_socket, selectors.EVENT_READ)
         self.start()
 
     def run(self):
-        while not self.zc.done:
-            with self.condition:
-                rs = self.readers.keys()
-                if len(rs) == 0:
-                    # No sockets to manage, but we wait for the timeout
-                    # or addition of a socket
-                    self.condition.wait(self.timeout)
-
-            if len(rs) != 0:
+        try:
+            while not self.zc.done:
                 try:
-                    rr, wr, er = select.select(rs, [], [], self.timeout)
-                    if not self.zc.done:
-                        for socket_ in rr:
-                            reader = self.readers.get(socket_)
-                            if reader:
-                                reader.handle_read(socket_)
-
-                except socket.error as e:
-                    # If the socket was closed by another thread, during
+                    events = self.selector.select(self.timeout)
+                except (OSError, ValueError):
+                    # If a socket was closed by another thread, during
                     # shutdown, ignore it and exit
-                    if e.errno != socket.EBADF or not self.zc.done:
-                        raise
+                    if self.zc.done:
+                        break
+                    raise
+
+                for key, _ in events:
+                    if key.fileobj is self._wakeup_socket:
+                        self._clear_wakeup()
+                    elif not self.zc.done:
+                        reader = self.readers.get(key.fileobj)
+                        if reader:
+                            reader.handle_read(key.fileobj)
+        finally:
+            self.selector.close()
+            self._wakeup_socket.close()
+            self._wakeup_trigger.close()
 
     def add_reader(self, reader, socket_):
-        with self.condition:
+        with self.lock:
             self.readers[socket_] = reader
-            self.condition.notify()
+            self.selector.register(socket_, selectors.EVENT_READ)
+        self.wakeup()
 
     def del_reader(self, socket_):
-        with self.condition:
+        with self.lock:
             del self.readers[socket_]
-            self.condition.notify()
+            try:
+                self.selector.unregister(socket_)
+            except (KeyError, ValueError):
+                pass
+        self.wakeup()
+
+    def wakeup(self):
+        """Wakes the engine up if it is waiting for sockets"""
+        try:
+            self._wakeup_trigger.send(b'\0')
+        except (OSError, ValueError):
+            # The socket buffer is full, so a wakeup is pending already,
+            # or the engine has stopped
+            pass
+
+    def _clear_wakeup(self):
+        try:
+            while self._wakeup_socket.recv(4096):
+                pass
+        except (OSError, ValueError):
+            pass
 
 
 class Listener(QuietLogger):
@@ -1139,12 +1299,25 @@ class Listener(QuietLogger):
     to cache information as it arrives.
 
     It requires registration with an Engine object in order to have
-    the read() method called when a socket is available for reading."""
+    the read() method called when a socket is available for reading.
+
+    Packets that can not hold anything zeroconf is interested in are
+    dropped before they are parsed; see is_relevant()."""
 
     def __init__(self, zc):
         self.zc = zc
         self.data = None
 
+        self.filter_packets = True
+        self.packets_dropped = 0
+        self.bytes_dropped = 0
+        self.packets_handled = 0
+        self.handle_time = 0.0  # seconds spent handling packets
+        self.filter_time = 0.0  # seconds spent deciding to drop packets
+
+        self._watched_labels = None
+        self._watched_version = None
+
     def handle_read(self, socket_):
         try:
             data, (addr, port) = socket_.recvfrom(_MAX_MSG_ABSOLUTE)
@@ -1155,6 +1328,18 @@ class Listener(QuietLogger):
         log.debug('Received from %r:%r: %r ', addr, port, data)
 
         self.data = data
+        start_time = time.perf_counter()
+        if self.filter_packets and not self.is_relevant(data):
+            self.packets_dropped += 1
+            self.bytes_dropped += len(data)
+            self.filter_time += time.perf_counter() - start_time
+            return
+
+        self.handle_packet(data, addr, port)
+        self.packets_handled += 1
+        self.handle_time += time.perf_counter() - start_time
+
+    def handle_packet(self, data, addr, port):
         msg = DNSIncoming(data)
         if not msg.valid:
             pass
@@ -1173,6 +1358,74 @@ class Listener(QuietLogger):
         else:
             self.zc.handle_response(msg)
 
+    def is_relevant(self, data):
+        """Returns false if a packet can not mention any of the names
+        zeroconf is interested in, without parsing it.
+
+        The first label of each of these names is looked for in the
+        packet.  A name compression pointer can only point to labels
+        elsewhere in the same packet, so every label of every name in
+        the packet is in there in full."""
+        if self.zc.services:
+            # Queries for registered services need to be answered
+            return True
+        labels = self.watched_labels()
+        if labels is None:
+            return True
+        data = data.lower()
+        for label in labels:
+            if label in data:
+                return True
+        return False
+
+    def watched_labels(self):
+        """Returns the encoded first labels of the service types that
+        are browsed, the services that are requested and the services in
+        the cache, or None if it is not known what the listeners of
+        zeroconf are interested in."""
+        version = (self.zc.listeners_version, self.zc.cache.services_version)
+        if version == self._watched_version:
+            return self._watched_labels
+
+        names = set()
+        for listener in list(self.zc.listeners):
+            if isinstance(listener, ServiceBrowser):
+                names.add(listener.type)
+            elif isinstance(listener, ServiceInfo):
+                names.add(listener.name)
+                if listener.server:
+                    names.add(listener.server)
+            else:
+                names = None
+                break
+        if names is not None:
+            for record in self.zc.cache.entries():
+                if record.type == _TYPE_SRV:
+                    names.add(record.name)
+                    names.add(record.server)
+
+        labels = None
+        if names is not None:
+            labels = set()
+            for name in names:
+                label = name.split('.')[0].encode('utf-8').lower()
+                if label:
+                    labels.add(int2byte(len(label)) + label)
+            labels = tuple(labels)
+
+        self._watched_labels = labels
+        self._watched_version = version
+        return labels
+
+    @property
+    def time_saved(self):
+        """Estimates the time not spent on handling the packets that
+        were dropped, less the time spent on dropping them, in seconds"""
+        if not self.packets_handled:
+            return 0.0
+        return (self.packets_dropped * self.handle_time /
+                self.packets_handled - self.filter_time)
+
 
 class Reaper(threading.Thread):
 
@@ -1187,14 +1440,17 @@ class Reaper(threading.Thread):
 
     def run(self):
         while True:
-            self.zc.wait(10 * 1000)
+            # Sleep until the next entry expires; new entries notify
+            # all waiting threads, so an earlier expiration is not missed
+            timeout = 10 * 1000
+            next_time = self.zc.cache.next_expiration_time()
+            if next_time is not None:
+                timeout = min(max(next_time - current_time_millis(), 0),
+                              timeout)
+            self.zc.wait(timeout)
             if self.zc.done:
                 return
-            now = current_time_millis()
-            for record in self.zc.cache.entries():
-                if record.is_expired(now):
-                    self.zc.update_record(now, record)
-                    self.zc.cache.remove(record)
+            self.zc.reap(current_time_millis())
 
 
 class Signal(object):
@@ -1249,6 +1505,12 @@ class ServiceBrowser(threading.Thread):
 
         self._service_state_changed = Signal()
 
+        # The question is the same for every query, so it is written once
+        self._query = DNSOutgoing(_FLAGS_QR_QUERY)
+        self._query.add_question(
+            DNSQuestion(self.type, _TYPE_PTR, _CLASS_IN))
+        self._query.write_questions()
+
         self.done = False
 
         if hasattr(handlers, 'add_service'):
@@ -1271,7 +1533,11 @@ class ServiceBrowser(threading.Thread):
         for h in handlers:
             self.service_state_changed.register_handler(h)
 
-        self.start()
+        if zc.threaded:
+            self.start()
+        else:
+            self.zc.add_listener(
+                self, DNSQuestion(self.type, _TYPE_PTR, _CLASS_IN))
 
     @property
     def service_state_changed(self):
@@ -1315,7 +1581,8 @@ class ServiceBrowser(threading.Thread):
     def cancel(self):
         self.done = True
         self.zc.remove_listener(self)
-        self.join()
+        if self.zc.threaded:
+            self.join()
 
     def run(self):
         self.zc.add_listener(self, DNSQuestion(self.type, _TYPE_PTR, _CLASS_IN))
@@ -1326,21 +1593,33 @@ class ServiceBrowser(threading.Thread):
                 self.zc.wait(self.next_time - now)
             if self.zc.done or self.done:
                 return
-            now = current_time_millis()
-            if self.next_time <= now:
-                out = DNSOutgoing(_FLAGS_QR_QUERY)
-                out.add_question(DNSQuestion(self.type, _TYPE_PTR, _CLASS_IN))
-                for record in self.services.values():
-                    if not record.is_expired(now):
-                        out.add_answer_at_time(record, now)
+            self.poll(current_time_millis())
+
+    def poll(self, now):
+        """Sends a query if one is due, and calls the handlers of the
+        changes that came in.  Returns the time at which the browser
+        needs to be polled again.
+
+        Browsers of a zeroconf instance that is not threaded are polled
+        by the owner of the instance."""
+        if self.zc.done or self.done:
+            return self.next_time
+
+        if self.next_time <= now:
+            out = self._query.copy()
+            for record in self.services.values():
+                if not record.is_expired(now):
+                    out.add_answer_at_time(record, now)
+
+            self.zc.send(out)
+            self.next_time = now + self.delay
+            self.delay = min(20 * 1000, self.delay * 2)
 
-                self.zc.send(out)
-                self.next_time = now + self.delay
-                self.delay = min(20 * 1000, self.delay * 2)
+        while len(self._handlers_to_call) > 0 and not self.zc.done:
+            handler = self._handlers_to_call.pop(0)
+            handler(self.zc)
 
-            if len(self._handlers_to_call) > 0 and not self.zc.done:
-                handler = self._handlers_to_call.pop(0)
-                handler(self.zc)
+        return self.next_time
 
 
 class ServiceInfo(object):
@@ -1657,14 +1936,23 @@ class Zeroconf(QuietLogger):
     def __init__(
         self,
         interfaces=InterfaceChoice.All,
+        threaded=True,
     ):
         """Creates an instance of the Zeroconf class, establishing
         multicast communications, listening and reaping threads.
 
+        If threaded is False, no threads are started.  Instead, the owner
+        of the instance calls listener.handle_read() when listen_socket
+        can be read, reap() when entries in the cache expire and poll()
+        on its service browsers, from its own event loop.  Methods that
+        wait for answers, such as get_service_info(), must then not be
+        called from that event loop.
+
         :type interfaces: :class:`InterfaceChoice` or sequence of ip addresses
         """
         # hook for threads
         self._GLOBAL_DONE = False
+        self.threaded = threaded
 
         self._listen_socket = new_socket()
         interfaces = normalize_interface_choice(interfaces, socket.AF_INET)
@@ -1699,6 +1987,7 @@ class Zeroconf(QuietLogger):
             self._respond_sockets.append(respond_socket)
 
         self.listeners = []
+        self.listeners_version = 0  # changes whenever listeners change
         self.browsers = {}
         self.services = {}
         self.servicetypes = {}
@@ -1707,10 +1996,14 @@ class Zeroconf(QuietLogger):
 
         self.condition = threading.Condition()
 
-        self.engine = Engine(self)
         self.listener = Listener(self)
-        self.engine.add_reader(self.listener, self._listen_socket)
-        self.reaper = Reaper(self)
+        if threaded:
+            self.engine = Engine(self)
+            self.engine.add_reader(self.listener, self._listen_socket)
+            self.reaper = Reaper(self)
+        else:
+            self.engine = None
+            self.reaper = None
 
         self.debug = None
 
@@ -1718,6 +2011,17 @@ class Zeroconf(QuietLogger):
     def done(self):
         return self._GLOBAL_DONE
 
+    @property
+    def listen_socket(self):
+        return self._listen_socket
+
+    def reap(self, now):
+        """Removes the entries that have expired from the cache, and
+        notifies the listeners."""
+        for record in self.cache.expired_entries(now):
+            self.update_record(now, record)
+            self.cache.remove(record)
+
     def wait(self, timeout):
         """Calling thread waits for a given number of milliseconds or
         until notified."""
@@ -1906,6 +2210,7 @@ class Zeroconf(QuietLogger):
         answer the question."""
         now = current_time_millis()
         self.listeners.append(listener)
+        self.listeners_version += 1
         if question is not None:
             for record in self.cache.entries_with_name(question.name):
                 if question.answered_by(record) and not record.is_expired(now):
@@ -1916,6 +2221,7 @@ class Zeroconf(QuietLogger):
         """Removes a listener."""
         try:
             self.listeners.remove(listener)
+            self.listeners_version += 1
             self.notify_all()
         except Exception as e:  # TODO stop catching all Exceptions
             log.exception('Unknown error, possibly benign: %r', e)
@@ -1932,16 +2238,13 @@ class Zeroconf(QuietLogger):
         are held in the cache, and listeners are notified."""
         now = current_time_millis()
         for record in msg.answers:
-            expired = record.is_expired(now)
-            if record in self.cache.entries():
-                if expired:
-                    self.cache.remove(record)
-                else:
-                    entry = self.cache.get(record)
-                    if entry is not None:
-                        entry.reset_ttl(record)
-            else:
+            entry = self.cache.get(record)
+            if entry is None:
                 self.cache.add(record)
+            elif record.is_expired(now):
+                self.cache.remove(record)
+            else:
+                self.cache.refresh(entry, record)
 
         for record in msg.answers:
             self.update_record(now, record)
@@ -2039,17 +2342,27 @@ class Zeroconf(QuietLogger):
         servicing further queries."""
         if not self._GLOBAL_DONE:
             self._GLOBAL_DONE = True
+            log.debug(
+                'Dropped %d of %d packets before parsing them, '
+                'saving an estimated %.3f seconds',
+                self.listener.packets_dropped,
+                self.listener.packets_dropped +
+                self.listener.packets_handled,
+                self.listener.time_saved)
             # remove service listeners
             self.remove_all_service_listeners()
             self.unregister_all_services()
 
             # shutdown recv socket and thread
-            self.engine.del_reader(self._listen_socket)
+            if self.engine is not None:
+                self.engine.del_reader(self._listen_socket)
             self._listen_socket.close()
-            self.engine.join()
+            if self.engine is not None:
+                self.engine.join()
 
             # shutdown the rest
             self.notify_all()
-            self.reaper.join()
+            if self.reaper is not None:
+                self.reaper.join()
             for s in self._respond_sockets:
                 s.close()